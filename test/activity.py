@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""Switching activity of every net in a dump, as SAIF and a hottest nets list.
+
+    python activity.py sim_build/activity.vcd                  # top 20 nets
+    python activity.py tb.vcd --saif tb.saif --json tb.json --top 50
+    python activity.py tb.vcd --start 100000 --stop 200000     # ns
+    python activity.py compare before.json after.json
+    python activity.py tests test_ASL_ZPG_Clear,test_ROL_ZPG_Loop
+
+For every bit of every net under --scope (tb.user_project by default) this
+counts the 0/1 toggles (TC) and the time spent at 0, 1 and X (T0, T1, TX)
+between --start and --stop, reading the dump a line at a time through
+wavestream.py. Works the same on RTL and gate level dumps; `make activity`
+dumps a workload (ACTIVITY_TESTS) and runs this on it. The SAIF is SAIF 2.0
+with the dump's timescale, for the power analysis of the netlist; --json
+keeps the counts for compare, which shows how the activity moved between two
+runs, e.g. before and after a change to instruction_decode.v. tests checks
+that a TESTCASE list names tests test.py has, which `make activity` does
+before it starts the simulation.
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+
+from run_shards import find_tests
+from sim_speed import CLK_PERIOD_NS
+from wavestream import open_dump, read_header
+
+T0, T1, TX, TC = range(4)
+
+
+def _in_scope(name, scope):
+    return (
+        not scope or name.startswith(scope + ".") or ("." + scope + ".") in ("." + name)
+    )
+
+
+def _bits(text, width):
+    # (ones, unknown) masks of a binary vcd value, extended to width the
+    # way vcd says: with 0, or with x/z if that is the leftmost bit
+    if len(text) < width:
+        fill = text[0] if text[0] in "xXzZ" else "0"
+        text = fill * (width - len(text)) + text
+    ones = int(text.translate(_ONES), 2)
+    unknown = int(text.translate(_UNKNOWN), 2)
+    return ones & ~unknown, unknown
+
+
+_ONES = str.maketrans("xXzZ", "0000")
+_UNKNOWN = str.maketrans("01xXzZ", "001111")
+
+
+def count(path, scope="tb.user_project", start=None, stop=None):
+    # returns ({net bit name: [t0, t1, tx, tc]}, duration, timescale, ns
+    # per time unit), the times in units of the dump's timescale
+    with open_dump(path) as lines:
+        variables, unit, timescale = read_header(lines)
+        lo = 0 if start is None else round(start / unit)
+        hi = None if stop is None else round(stop / unit)
+
+        # nets that share an id (a port and what it connects to) are only
+        # counted once and reported under every name
+        widths = {}
+        names = []
+        for ident, name, width, bits in variables:
+            if _in_scope(name, scope):
+                widths[ident] = width
+                names.append((ident, name, width, bits))
+        stats = {ident: [[0, 0, 0, 0] for _ in range(w)] for ident, w in widths.items()}
+        ones = dict.fromkeys(widths, 0)
+        unknown = {ident: (1 << w) - 1 for ident, w in widths.items()}
+        since = dict.fromkeys(widths, lo)
+
+        def settle(ident, now):
+            # add the time since the net last changed, inside the window
+            begin = since[ident]
+            end = now if hi is None else min(now, hi)
+            if end > begin:
+                duration = end - begin
+                v, x = ones[ident], unknown[ident]
+                for bit, s in enumerate(stats[ident]):
+                    if (x >> bit) & 1:
+                        s[TX] += duration
+                    elif (v >> bit) & 1:
+                        s[T1] += duration
+                    else:
+                        s[T0] += duration
+            since[ident] = max(now, lo)
+
+        now = 0
+        for line in lines:
+            c = line[0:1]
+            if c == "#":
+                now = int(line[1:])
+                if hi is not None and now >= hi:
+                    break
+                continue
+            if c == "$" or not line.strip():
+                continue
+            tokens = line.split()
+            i = 0
+            while i < len(tokens):
+                token = tokens[i]
+                if token[0] in "bB":
+                    text, ident = token[1:], tokens[i + 1]
+                    i += 2
+                elif token[0] in "01xXzZ":
+                    text, ident = token[0], token[1:]
+                    i += 1
+                else:
+                    i += 2 if token[0] in "rR" else 1
+                    continue
+                width = widths.get(ident)
+                if width is None:
+                    continue
+                v, x = _bits(text, width)
+                settle(ident, now)
+                if now >= lo:
+                    # a toggle is a 0/1 change, to or from x doesn't count
+                    toggled = (v ^ ones[ident]) & ~(x | unknown[ident])
+                    bit = 0
+                    while toggled:
+                        if toggled & 1:
+                            stats[ident][bit][TC] += 1
+                        toggled >>= 1
+                        bit += 1
+                ones[ident], unknown[ident] = v, x
+
+        end = now if hi is None else hi
+        for ident in widths:
+            settle(ident, end)
+
+    nets = {}
+    for ident, name, width, bits in names:
+        if width == 1:
+            nets[name] = stats[ident][0]
+        else:
+            for bit, number in enumerate(bits):
+                nets[f"{name}[{number}]"] = stats[ident][bit]
+    return nets, max(end - lo, 0), timescale, unit
+
+
+def _saif_name(name):
+    return re.sub(r"(\W)", r"\\\1", name)
+
+
+def write_saif(path, nets, duration, timescale):
+    # SAIF 2.0, one INSTANCE per scope
+    tree = {}
+    for name, s in nets.items():
+        *scopes, net = re.split(r"\.(?![^\[]*\])", name)
+        node = tree
+        for scope in scopes:
+            node = node.setdefault(scope, {})
+        node.setdefault(None, []).append((net, s))
+
+    number = timescale.rstrip("munpfs")
+    out = [
+        "(SAIFILE",
+        '(SAIFVERSION "2.0")',
+        '(DIRECTION "backward")',
+        '(DESIGN "tb")',
+        f'(DATE "{time.strftime("%a %b %d %H:%M:%S %Y")}")',
+        '(VENDOR "tt_um_6502")',
+        '(PROGRAM_NAME "activity.py")',
+        '(VERSION "1.0")',
+        "(DIVIDER . )",
+        f"(TIMESCALE {number} {timescale[len(number):]})",
+        f"(DURATION {duration})",
+    ]
+
+    def instance(name, node, indent):
+        pad = "  " * indent
+        out.append(f"{pad}(INSTANCE {_saif_name(name)}")
+        if None in node:
+            out.append(f"{pad}  (NET")
+            for net, s in sorted(node[None]):
+                out.append(
+                    f"{pad}    ({_saif_name(net)}"
+                    f" (T0 {s[T0]}) (T1 {s[T1]}) (TX {s[TX]}) (TC {s[TC]}) (IG 0))"
+                )
+            out.append(f"{pad}  )")
+        for child, sub in sorted((k, v) for k, v in node.items() if k is not None):
+            instance(child, sub, indent + 1)
+        out.append(f"{pad})")
+
+    for name, node in sorted((k, v) for k, v in tree.items() if k is not None):
+        instance(name, node, 0)
+    out.append(")")
+    with open(path, "w") as f:
+        f.write("\n".join(out) + "\n")
+
+
+def top(nets, duration, unit, n):
+    # the n nets that toggle most, with toggles per clk cycle and the
+    # fraction of the time they were high
+    cycles = duration * unit / CLK_PERIOD_NS
+    rows = sorted(nets.items(), key=lambda item: (-item[1][TC], item[0]))[:n]
+    print(f"{'net':<56} {'toggles':>10} {'per cycle':>10} {'high':>6}")
+    for name, s in rows:
+        known = s[T0] + s[T1]
+        rate = s[TC] / cycles if cycles else 0
+        high = s[T1] / known if known else 0
+        print(f"{name:<56} {s[TC]:>10} {rate:>10.3f} {high:>6.1%}")
+    total = sum(s[TC] for s in nets.values())
+    print(f"{len(nets)} net bits, {total} toggles over {cycles:,.0f} clk cycles")
+
+
+def compare(a, b, n):
+    with open(a) as f:
+        before = json.load(f)
+    with open(b) as f:
+        after = json.load(f)
+    old, new = before["nets"], after["nets"]
+    total_old = sum(s[TC] for s in old.values())
+    total_new = sum(s[TC] for s in new.values())
+    change = (total_new - total_old) / total_old if total_old else 0
+    print(f"toggles {total_old} -> {total_new} ({change:+.1%})")
+    deltas = sorted(
+        ((new.get(k, [0] * 4)[TC] - old.get(k, [0] * 4)[TC], k) for k in old | new),
+        key=lambda item: (-abs(item[0]), item[1]),
+    )
+    for delta, name in deltas[:n]:
+        if delta:
+            print(f"  {delta:>+10} {name}")
+    only = sorted(set(new) - set(old)), sorted(set(old) - set(new))
+    if only[0] or only[1]:
+        print(f"{len(only[0])} nets only in {b}, {len(only[1])} only in {a}")
+    return 0
+
+
+def check_tests(names, module="test"):
+    unknown = [name for name in names if name not in find_tests(module)]
+    if unknown:
+        print(f"no {', '.join(unknown)} in {module}.py")
+        return 1
+    return 0
+
+
+def main():
+    if sys.argv[1:2] == ["tests"]:
+        parser = argparse.ArgumentParser(prog="activity.py tests")
+        parser.add_argument("testcase", help="comma separated, as for TESTCASE")
+        args = parser.parse_args(sys.argv[2:])
+        return check_tests(args.testcase.split(","))
+
+    if sys.argv[1:2] == ["compare"]:
+        parser = argparse.ArgumentParser(prog="activity.py compare")
+        parser.add_argument("before")
+        parser.add_argument("after")
+        parser.add_argument("--top", type=int, default=20)
+        args = parser.parse_args(sys.argv[2:])
+        return compare(args.before, args.after, args.top)
+
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("dump")
+    parser.add_argument("--scope", default="tb.user_project")
+    parser.add_argument("--start", type=float, help="ns")
+    parser.add_argument("--stop", type=float, help="ns")
+    parser.add_argument("--saif")
+    parser.add_argument("--json")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    nets, duration, timescale, unit = count(
+        args.dump, args.scope, args.start, args.stop
+    )
+    if not nets:
+        print(f"nothing under {args.scope} in {args.dump}")
+        return 1
+    if args.saif:
+        write_saif(args.saif, nets, duration, timescale)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {"timescale": timescale, "duration": duration, "nets": nets},
+                f,
+                indent=1,
+                sort_keys=True,
+            )
+    top(nets, duration, unit, args.top)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
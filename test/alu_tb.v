@@ -0,0 +1,53 @@
+`default_nettype none
+`timescale 1ns / 1ps
+
+/* Standalone testbench for the ALU. test_alu.py picks an alu_op and raises
+   start, then this runs every {carry in, inputA, inputB} through the ALU, one
+   clk each, and writes {ALU_flags_output, ALU_output} for all of them to
+   +sweep_file (alu_sweep.hex by default) before raising done. Doing the sweep
+   here keeps Python out of the 131072 cycles per op.
+*/
+module alu_tb ();
+
+  reg clk = 0;
+  reg start = 0;
+  reg done = 0;
+  reg [4:0] alu_op = 0;
+  reg [7:0] inputA = 0;
+  reg [7:0] inputB = 0;
+  reg [6:0] status_flags_in = 0;
+  wire [7:0] ALU_output;
+  wire [6:0] ALU_flags_output;
+
+  alu ALU (
+      .clk             (clk),
+      .alu_op          (alu_op),
+      .inputA          (inputA),
+      .inputB          (inputB),
+      .status_flags_in (status_flags_in),
+      .ALU_output      (ALU_output),
+      .ALU_flags_output(ALU_flags_output)
+  );
+
+  reg [14:0] results[0:131071];
+  reg [1023:0] sweep_file;
+  integer i;
+
+  initial begin
+    if (!$value$plusargs("sweep_file=%s", sweep_file)) sweep_file = "alu_sweep.hex";
+  end
+
+  // only on the rising edge: test_alu.py drops start again after each op
+  always @(posedge start) begin
+    done = 0;
+    for (i = 0; i < 131072; i = i + 1) begin
+      {status_flags_in[0], inputA, inputB} = i[16:0];
+      #1 clk = 1;  // ALU_output is registered
+      #1 clk = 0;
+      results[i] = {ALU_flags_output, ALU_output};
+    end
+    $writememh(sweep_file, results);
+    done = 1;
+  end
+
+endmodule
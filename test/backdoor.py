@@ -0,0 +1,84 @@
+from cocotb.triggers import FallingEdge
+
+# backdoor access to the cpu registers, so a test can set up the state an
+# instruction starts from without running instructions to get there, and check
+# what it left without running more to get it onto the bus. deposits are rtl
+# only. read_state also tries the gate level netlist, see there.
+#
+# the registers are all written on the falling edge of clk_cpu, from next_*
+# values that keep them as they are unless the current state loads them. a
+# value deposited after that edge therefore stays until a state loads the
+# register again. the place to do it is the low phase of the last state of
+# an instruction: nothing loads a register before the next instruction does,
+# and the pc deposited there is the one its opcode is fetched from.
+
+# src/instruction_decode.v
+S_OPCODE_READ = 1
+
+# name -> signal in user_project, named as in model.CPU.state()
+REGISTERS = {
+    "a": "accumulator",
+    "x": "index_register_x",
+    "y": "index_register_y",
+    "p": "processor_status_register",
+    "pc": "pc",
+}
+WIDTHS = {"a": 8, "x": 8, "y": 8, "p": 7, "pc": 16}
+
+
+def deposit(dut, **values):
+    # write registers straight away, e.g. deposit(dut, a=0x12, pc=0x0200).
+    # the writes land once the current time step has settled, after anything
+    # the design does on the same edge, so call this from a safe point
+    user_project = dut.user_project
+    for name, value in values.items():
+        if name not in REGISTERS:
+            raise ValueError(f"no register {name}, only {', '.join(REGISTERS)}")
+        getattr(user_project, REGISTERS[name]).value = value
+
+
+def read_state(dut, names=REGISTERS):
+    # the registers as a dict like model.CPU.state(). the values are the
+    # ones from the last falling edge of clk_cpu, so read them anywhere in
+    # the low phase of the last state of an instruction to get what it left.
+    #
+    # at gate level the registers are flip-flops, one per bit. when synthesis
+    # kept their names the bits are nets called \accumulator[0] and so on,
+    # which are read instead; if it didn't there's no way in and this raises
+    # a RuntimeError, check with the bus (e.g. a store) instead
+    user_project = dut.user_project
+    state = {}
+    for name in names:
+        signal = REGISTERS[name]
+        try:
+            state[name] = getattr(user_project, signal).value.integer
+            continue
+        except AttributeError:
+            pass
+        value = 0
+        for i in range(WIDTHS[name]):
+            try:
+                bit = user_project._id(f"{signal}[{i}]", extended=True)
+            except AttributeError:
+                raise RuntimeError(
+                    f"{signal} is not in the netlist, synthesis renamed it"
+                ) from None
+            value |= bit.value.integer << i
+        state[name] = value
+    return state
+
+
+async def preload(dut, **values):
+    # wait for the current instruction to get to the low phase of its last
+    # state (the decoder is about to go to S_OPCODE_READ) and deposit there.
+    # for tests that run the cpu from memory.Memory; driver.Driver.deposit
+    # does the same without giving up its own timing
+    user_project = dut.user_project
+    clk_cpu = user_project.clk_cpu
+    next_state = user_project.instructionDecode.NEXT_STATE
+    edge = FallingEdge(dut.clk)
+    while True:
+        await edge
+        if not clk_cpu.value and next_state.value == S_OPCODE_READ:
+            break
+    deposit(dut, **values)
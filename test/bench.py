@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""Benchmark the simulation and keep a history of the results.
+
+    python bench.py run                          # every workload, RTL
+    python bench.py run --configs rtl gl         # also at gate level
+    python bench.py run --save-baseline          # and make this the baseline
+    python bench.py compare --threshold 10       # latest results vs baseline
+
+Each workload is a set of tests run through make. For every run the wall
+time of the whole make, the time spent in the tests, the clk cycles they
+simulated, cycles per second and the peak RSS of the simulator are appended
+to the history file. compare exits with 1 if any workload is slower (in
+cycles per second) or bigger (in peak RSS) than the baseline by more than the
+threshold.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+from sim_speed import CLK_PERIOD_NS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# alu_tb.v clocks the ALU itself, one clk every 2 ns (#1 high, #1 low)
+ALU_PERIOD_NS = 2
+
+# make arguments, tests and the clk period the cycles are counted in
+WORKLOADS = {
+    "zpg_shift": (
+        [],
+        [
+            "test_ASL_ZPG_Clear",
+            "test_LSR_ZPG_Clear",
+            "test_ROL_ZPG_Loop",
+            "test_ROR_ZPG_Loop",
+        ],
+        CLK_PERIOD_NS,
+    ),
+    "abs_shift": (
+        [],
+        [
+            "test_ASL_ABS_Clear",
+            "test_LSR_ABS_Clear",
+            "test_ROL_ABS_Loop",
+            "test_ROR_ABS_Loop",
+        ],
+        CLK_PERIOD_NS,
+    ),
+    "random_program": (["PROGRAM_SEED=1"], ["test_Random_Long_Program"], CLK_PERIOD_NS),
+    "alu_sweep": (["ALU=yes"], None, ALU_PERIOD_NS),
+}
+
+CONFIGS = {
+    "rtl": [],
+    "gl": ["GATES=yes"],
+}
+
+# the ALU has no gate level version of its own
+RTL_ONLY = {"alu_sweep"}
+
+
+def git_commit():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=HERE,
+            capture_output=True,
+            text=True,
+        )
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def run_workload(config, workload, make_args):
+    # the results, or None if make wrote none (it failed to build, say)
+    args, tests, period = WORKLOADS[workload]
+    results = f"sim_build/bench_{config}_{workload}.xml"
+    cmd = [
+        "make",
+        f"COCOTB_RESULTS_FILE={results}",
+        *CONFIGS[config],
+        *args,
+        *make_args,
+    ]
+    if tests:
+        cmd.append(f"TESTCASE={','.join(tests)}")
+
+    start = time.monotonic()
+    proc = subprocess.Popen(cmd, cwd=HERE, stdout=subprocess.DEVNULL)
+    # wait4 gives the rusage of make and everything it waited for, so
+    # ru_maxrss is the biggest of them, i.e. the simulator
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.monotonic() - start
+
+    try:
+        root = ET.parse(os.path.join(HERE, results)).getroot()
+    except (OSError, ET.ParseError):
+        print(f"{config}/{workload}: make exited with {proc.returncode}, no results")
+        return None
+
+    cycles = 0.0
+    test_time = 0.0
+    failures = 0
+    for case in root.iter("testcase"):
+        cycles += float(case.get("sim_time_ns", 0)) / period
+        test_time += float(case.get("time", 0))
+        if case.find("failure") is not None or case.find("error") is not None:
+            failures += 1
+
+    return {
+        "wall_s": round(wall, 3),
+        "test_s": round(test_time, 3),
+        "cycles": int(cycles),
+        "cycles_per_s": round(cycles / test_time, 1) if test_time else 0.0,
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+        "failures": failures,
+    }
+
+
+def load(path, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def save(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def print_results(results):
+    print(
+        f"{'config':<6} {'workload':<16} {'wall s':>8} {'test s':>8} "
+        f"{'cycles':>10} {'cycles/s':>10} {'rss MB':>8}"
+    )
+    for key, r in sorted(results.items()):
+        config, workload = key.split("/")
+        print(
+            f"{config:<6} {workload:<16} {r['wall_s']:>8.1f} {r['test_s']:>8.1f} "
+            f"{r['cycles']:>10} {r['cycles_per_s']:>10,.0f} {r['peak_rss_mb']:>8.1f}"
+            + (f"  {r['failures']} FAILED" if r["failures"] else "")
+        )
+
+
+def compare(results, baseline, threshold):
+    # (key, metric, baseline value, new value) for everything worse than the
+    # threshold, in percent
+    regressions = []
+    for key, r in sorted(results.items()):
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if base["cycles_per_s"] and r["cycles_per_s"] < base["cycles_per_s"] * (
+            1 - threshold / 100
+        ):
+            regressions.append(
+                (key, "cycles_per_s", base["cycles_per_s"], r["cycles_per_s"])
+            )
+        if base["peak_rss_mb"] and r["peak_rss_mb"] > base["peak_rss_mb"] * (
+            1 + threshold / 100
+        ):
+            regressions.append(
+                (key, "peak_rss_mb", base["peak_rss_mb"], r["peak_rss_mb"])
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("command", choices=["run", "compare"])
+    parser.add_argument("--workloads", nargs="+", default=list(WORKLOADS))
+    parser.add_argument("--configs", nargs="+", default=["rtl"])
+    parser.add_argument("--history", default=os.path.join(HERE, "bench_history.json"))
+    parser.add_argument("--baseline", default=os.path.join(HERE, "bench_baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--threshold", type=float, default=10.0, help="allowed slowdown in percent"
+    )
+    parser.add_argument("make_args", nargs="*", help="e.g. SIM=verilator")
+    args = parser.parse_args()
+
+    history = load(args.history, [])
+
+    if args.command == "run":
+        results = {}
+        broken = []
+        for config in args.configs:
+            for workload in args.workloads:
+                if config != "rtl" and workload in RTL_ONLY:
+                    continue
+                print(f"running {config}/{workload}", flush=True)
+                result = run_workload(config, workload, args.make_args)
+                if result is None:
+                    broken.append(f"{config}/{workload}")
+                else:
+                    results[f"{config}/{workload}"] = result
+        history.append(
+            {
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "commit": git_commit(),
+                "make_args": args.make_args,
+                "results": results,
+            }
+        )
+        save(args.history, history)
+        if args.save_baseline:
+            save(args.baseline, results)
+        print_results(results)
+        for key in broken:
+            print(f"{key} FAILED to run")
+        return 1 if broken or any(r["failures"] for r in results.values()) else 0
+
+    if not history:
+        print(f"no runs in {args.history}, run the benchmarks first")
+        return 1
+    baseline = load(args.baseline, None)
+    if baseline is None:
+        print(f"no baseline in {args.baseline}, run with --save-baseline first")
+        return 1
+
+    # the latest result for every config/workload, which may come from
+    # different runs if only some workloads were rerun
+    results = {}
+    for entry in history:
+        results.update(entry["results"])
+    print_results(results)
+
+    regressions = compare(results, baseline, args.threshold)
+    for key, metric, old, new in regressions:
+        print(f"REGRESSION {key} {metric}: {old} -> {new}")
+    if not regressions:
+        print(f"no regressions beyond {args.threshold}%")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""Cache compiled simulator images between make runs.
+
+The key is a hash of every verilog source, everything they `include (found
+through the -I directories in the compile arguments), the compile arguments
+themselves, the C++ compiler flags for verilator and the simulator and cocotb
+versions. The Makefile calls
+
+    build_cache.py restore ...   while it is being read, before any rule runs
+    build_cache.py save ...      once the image has been built
+
+so an unchanged design is copied out of the cache instead of recompiled, and
+a changed one has its stale image removed so make is forced to rebuild it.
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# files the simulator's compile step leaves in SIM_BUILD that the run needs
+IMAGES = {
+    "icarus": ["cmds.f", "sim.vvp"],
+    # Vtop.mk first, so the restored Vtop is the newer of the two
+    "verilator": ["Vtop.mk", "Vtop"],
+}
+
+VERSION_COMMANDS = {
+    "icarus": ["iverilog", "-V"],
+    "verilator": ["verilator", "--version"],
+}
+
+# verilator builds the image with the C++ compiler, which takes its flags
+# from the environment
+ENVIRONMENT = {
+    "icarus": [],
+    "verilator": ["CXXFLAGS", "LDFLAGS"],
+}
+
+INCLUDE = re.compile(rb'^\s*`include\s+"([^"]+)"', re.MULTILINE)
+
+
+def tool_version(cmd):
+    try:
+        out = subprocess.run(cmd, capture_output=True, timeout=30).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return b"unknown"
+    return out.splitlines()[0] if out else b"unknown"
+
+
+def source_files(sources, include_dirs):
+    # every source plus everything it pulls in through `include, in the order
+    # they are first seen
+    seen = []
+    pending = [os.path.abspath(s) for s in sources]
+    while pending:
+        path = pending.pop(0)
+        if path in seen or not os.path.isfile(path):
+            continue
+        seen.append(path)
+        with open(path, "rb") as f:
+            text = f.read()
+        for name in INCLUDE.findall(text):
+            name = name.decode()
+            for base in [os.path.dirname(path), *include_dirs]:
+                candidate = os.path.abspath(os.path.join(base, name))
+                if os.path.isfile(candidate):
+                    pending.append(candidate)
+                    break
+    return seen
+
+
+def build_key(sim, compile_args, sources):
+    include_dirs = [a[2:] for a in compile_args if a.startswith("-I")]
+
+    h = hashlib.sha256()
+    h.update(sim.encode() + b"\0")
+    h.update(tool_version(VERSION_COMMANDS[sim]) + b"\0")
+    h.update(tool_version(["cocotb-config", "--version"]) + b"\0")
+    for arg in compile_args:
+        h.update(arg.encode() + b"\0")
+    for name in ENVIRONMENT[sim]:
+        h.update(f"{name}={os.environ.get(name, '')}".encode() + b"\0")
+    for path in source_files(sources, include_dirs):
+        h.update(path.encode() + b"\0")
+        with open(path, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+def restore(sim_build, cache, sim, key):
+    os.makedirs(sim_build, exist_ok=True)
+    key_file = os.path.join(sim_build, "build.key")
+    images = [os.path.join(sim_build, name) for name in IMAGES[sim]]
+
+    try:
+        with open(key_file) as f:
+            built = f.read().strip()
+    except OSError:
+        built = None
+    if built == key and all(os.path.exists(p) for p in images):
+        return "current"
+
+    entry = os.path.join(cache, key)
+    if all(os.path.exists(os.path.join(entry, name)) for name in IMAGES[sim]):
+        # plain copy, not copy2, so the image is newer than every source and
+        # make leaves it alone
+        for name, path in zip(IMAGES[sim], images):
+            shutil.copy(os.path.join(entry, name), path)
+        status = "hit"
+    else:
+        for path in images:
+            if os.path.exists(path):
+                os.remove(path)
+        status = "miss"
+
+    with open(key_file, "w") as f:
+        f.write(key + "\n")
+    return status
+
+
+def save(sim_build, cache, sim):
+    try:
+        with open(os.path.join(sim_build, "build.key")) as f:
+            key = f.read().strip()
+    except OSError:
+        return
+    entry = os.path.join(cache, key)
+    if os.path.isdir(entry):
+        return
+
+    # several shards can finish building the same image at once, so fill a
+    # private directory and rename it into place
+    os.makedirs(cache, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=cache)
+    for name in IMAGES[sim]:
+        shutil.copy2(os.path.join(sim_build, name), staging)
+    try:
+        os.rename(staging, entry)
+    except OSError:
+        shutil.rmtree(staging)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        epilog="key and restore take the compile arguments and sources after --",
+    )
+    parser.add_argument("command", choices=["key", "restore", "save"])
+    parser.add_argument("--sim", default="icarus")
+    parser.add_argument("--sim-build", default=os.path.join(HERE, "sim_build/rtl"))
+    parser.add_argument("--cache", default=os.path.join(HERE, ".build_cache"))
+    argv = sys.argv[1:]
+    compile_line = []
+    if "--" in argv:
+        split = argv.index("--")
+        argv, compile_line = argv[:split], argv[split + 1 :]
+    args = parser.parse_args(argv)
+
+    if args.sim not in IMAGES:
+        print("off")
+        return 0
+
+    if args.command == "save":
+        save(args.sim_build, args.cache, args.sim)
+        return 0
+
+    compile_args = [a for a in compile_line if a.startswith("-")]
+    sources = [a for a in compile_line if not a.startswith("-")]
+    key = build_key(args.sim, compile_args, sources)
+    if args.command == "key":
+        print(key)
+    else:
+        print(restore(args.sim_build, args.cache, args.sim, key))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+import os
+from array import array
+
+import cocotb
+from cocotb.triggers import FallingEdge, ReadOnly
+
+# pin traces of a run, one record per clk period:
+#   flags, ui_in, uio_in, uo_out, uio_out, uio_oe
+# flags has rst_n in bit 0, ena in bit 1, and bit 2 set when the outputs were
+# all 0/1 (they are X until the design has been reset).
+#
+# a record is taken at the falling edge of clk, once everything written at
+# that time has landed, so the inputs are the ones the design sees at the
+# next rising edge and the outputs are settled. the outputs don't depend
+# combinationally on the inputs, so a replay can check them and then drive
+# the next inputs in the same callback.
+#
+# clk_cpu isn't reset, so a replay only lines up with its recording if
+# clk_cpu is in the same phase when reset is let go. in reset uio_out is
+# rw = 1 while clk_cpu is low and 0 while it is high, which replay asserts
+# matches the recording there.
+
+MAGIC = b"6502TRC1"
+RECORD = 6
+RST_N = 1
+ENA = 2
+VALID = 4
+
+# clk periods of reset before a replay starts comparing (two cpu cycles)
+RESET_CYCLES = 4
+
+
+def load(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a pin trace")
+        return array("B", f.read())
+
+
+class Recorder:
+    def __init__(self, dut, path):
+        self.dut = dut
+        self.path = path
+        self.data = array("B")
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = cocotb.start_soon(self._run())
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "wb") as f:
+            f.write(MAGIC)
+            self.data.tofile(f)
+
+    async def _run(self):
+        dut = self.dut
+        pins = (dut.ui_in, dut.uio_in, dut.uo_out, dut.uio_out, dut.uio_oe)
+        rst_n = dut.rst_n
+        ena = dut.ena
+        edge = FallingEdge(dut.clk)
+        settled = ReadOnly()
+        append = self.data.extend
+
+        # the test gets killed at its end, which closes this coroutine, so the
+        # trace is written out from the finally
+        try:
+            while True:
+                await edge
+                await settled
+                values = [p.value for p in pins]
+                flags = VALID if all(v.is_resolvable for v in values[2:]) else 0
+                if rst_n.value.is_resolvable and rst_n.value.integer:
+                    flags |= RST_N
+                if ena.value.is_resolvable and ena.value.integer:
+                    flags |= ENA
+                append((flags, *(v.integer if v.is_resolvable else 0 for v in values)))
+        finally:
+            self.save()
+
+
+# TRACE_RECORD=<dir> in the Makefile (see helper.INSTRUMENTS) records every
+# test to its own file there, NNN_<test>.trace, numbered in the order the
+# tests ran so they can be replayed in that order
+_recorded = 0
+
+
+def start_instrument(dut, trace_dir, test):
+    global _recorded
+    path = os.path.join(trace_dir, f"{_recorded:03d}_{test}.trace")
+    Recorder(dut, path).start()
+    _recorded += 1
+
+
+async def replay(dut, data, name="trace", max_errors=8):
+    # drive the design from a recorded trace and compare its outputs. the
+    # outputs are only compared once the trace has held the cpu in reset for
+    # two cpu cycles, so a trace can be replayed on a design that has been
+    # doing something else. returns the number of mismatching cycles
+    ui_in = dut.ui_in
+    uio_in = dut.uio_in
+    rst_n = dut.rst_n
+    ena = dut.ena
+    outputs = (dut.uo_out, dut.uio_out, dut.uio_oe)
+    edge = FallingEdge(dut.clk)
+
+    last = None
+    in_reset = 0
+    errors = 0
+    for start in range(0, len(data) - RECORD + 1, RECORD):
+        flags, ui, uio, *expected = data[start : start + RECORD]
+        await edge
+
+        if flags & RST_N and flags & VALID and in_reset and not last[0] & RST_N:
+            rw = outputs[1].value
+            assert rw.is_resolvable and rw.integer & 1 == expected[1] & 1, (
+                f"{name} cycle {start // RECORD}: clk_cpu is a phase out from "
+                "the recording where reset is let go"
+            )
+
+        if in_reset >= RESET_CYCLES and flags & VALID:
+            got = [p.value for p in outputs]
+            if (
+                not all(v.is_resolvable for v in got)
+                or [v.integer for v in got] != expected
+            ):
+                errors += 1
+                if errors <= max_errors:
+                    dut._log.error(
+                        f"{name} cycle {start // RECORD}: uo_out/uio_out/uio_oe "
+                        f"{'/'.join(str(v) for v in got)}, expected "
+                        f"{'/'.join(f'{v:08b}' for v in expected)}"
+                    )
+        elif not flags & RST_N:
+            in_reset += 1
+
+        inputs = (flags & (RST_N | ENA), ui, uio)
+        if inputs != last:
+            rst_n.setimmediatevalue(flags & RST_N)
+            ena.setimmediatevalue(1 if flags & ENA else 0)
+            ui_in.setimmediatevalue(ui)
+            uio_in.setimmediatevalue(uio)
+            last = inputs
+    return errors
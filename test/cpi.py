@@ -0,0 +1,182 @@
+import json
+import os
+import re
+
+import cocotb
+from cocotb.triggers import FallingEdge
+
+import opcodes
+
+# cycles per instruction, broken down by the decoder state each cycle was
+# spent in. STATE and OPCODE only change on the rising edge of clk_cpu, so
+# they are sampled once per cpu cycle on its falling edge. an instruction
+# starts when the decoder enters S_OPCODE_READ (which is also when OPCODE is
+# latched) and runs until it enters it again, so the cycle spent fetching the
+# next opcode is counted with the instruction before it. cycles in reset
+# aren't counted. rtl only, the netlist has no decoder to look at.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _read(path):
+    with open(os.path.join(HERE, path)) as f:
+        return f.read()
+
+
+STATES = {
+    int(value): name
+    for name, value in re.findall(
+        r"localparam\s+(S_\w+)\s*=\s*4'd(\d+)", _read("../src/instruction_decode.v")
+    )
+}
+S_OPCODE_READ = next(v for v, name in STATES.items() if name == "S_OPCODE_READ")
+
+# a value defined twice gets both names
+OPCODE_NAMES = {}
+for _opcode in opcodes.TABLE:
+    OPCODE_NAMES[_opcode.value] = "/".join(
+        filter(None, [OPCODE_NAMES.get(_opcode.value), _opcode.name])
+    )
+
+MODE_NAMES = {value: name for name, value in opcodes.MODES.items()}
+
+
+def mode_name(op):
+    # the addressing mode from the opcode table, or from OPCODE[4:2] for
+    # opcodes it doesn't have
+    opcode = opcodes.OPCODES.get(op)
+    if opcode is not None:
+        return opcode.mode
+    bits = (op >> 2) & 0b111
+    return MODE_NAMES.get(bits, f"{bits:03b}")
+
+
+class CPIProfile:
+    def __init__(self):
+        self.cycles = [0] * (256 * 16)  # [(opcode << 4) | state]
+        self.instructions = [0] * 256
+        self._task = None
+
+    def start(self, dut, path=None):
+        # counts carry on from earlier tests; with a path the report is
+        # written there (and a table next to it) when the test ends
+        if self._task is None:
+            self._task = cocotb.start_soon(self._run(dut, path))
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    async def _run(self, dut, path):
+        decode = dut.user_project.instructionDecode
+        state = decode.STATE
+        opcode = decode.OPCODE
+        rst_n = dut.rst_n
+        edge = FallingEdge(dut.user_project.clk_cpu)
+        cycles = self.cycles
+        instructions = self.instructions
+        current = None
+
+        try:
+            while True:
+                await edge
+                reset = rst_n.value
+                if not (reset.is_resolvable and reset.integer):
+                    current = None
+                    continue
+                s = state.value.integer
+                if s == S_OPCODE_READ:
+                    current = opcode.value.integer
+                    instructions[current] += 1
+                    current <<= 4
+                if current is not None:
+                    cycles[current | s] += 1
+        finally:
+            # the test gets killed at its end, which closes this coroutine
+            self._task = None
+            if path:
+                self.save(path)
+
+    def report(self):
+        by_opcode = {}
+        modes = {}
+        for op in range(256):
+            row = self.cycles[op << 4 : (op + 1) << 4]
+            total = sum(row)
+            if not total:
+                continue
+            mode = mode_name(op)
+            states = {STATES.get(s, str(s)): n for s, n in enumerate(row) if n}
+            count = self.instructions[op]
+            known = opcodes.OPCODES.get(op)
+            by_opcode[f"{op:02x}"] = {
+                "name": OPCODE_NAMES.get(op, "?"),
+                "mode": mode,
+                "instructions": count,
+                "cycles": total,
+                "cpi": round(total / count, 3) if count else None,
+                "expected_cpi": known.cycles if known is not None else None,
+                "states": states,
+            }
+
+            summary = modes.setdefault(
+                mode, {"instructions": 0, "cycles": 0, "states": {}}
+            )
+            summary["instructions"] += count
+            summary["cycles"] += total
+            for name, n in states.items():
+                summary["states"][name] = summary["states"].get(name, 0) + n
+
+        for summary in modes.values():
+            count = summary["instructions"]
+            summary["cpi"] = round(summary["cycles"] / count, 3) if count else None
+        return {"opcodes": by_opcode, "modes": modes}
+
+    def table(self):
+        # one column per decoder state that was seen, headed by its number,
+        # with the names of those states listed underneath
+        report = self.report()
+        used = [
+            s
+            for s in sorted(STATES)
+            if any(STATES[s] in row["states"] for row in report["opcodes"].values())
+        ]
+
+        lines = [
+            f"{'opcode':<8}{'name':<20}{'mode':<8}{'count':>9}{'cpi':>8}{'expect':>8}"
+            + "".join(f"{s:>8}" for s in used)
+        ]
+        for op, row in sorted(report["opcodes"].items()):
+            cpi = f"{row['cpi']:.2f}" if row["cpi"] is not None else "-"
+            expected = row["expected_cpi"] if row["expected_cpi"] is not None else "-"
+            lines.append(
+                f"{op:<8}{row['name']:<20}{row['mode']:<8}"
+                f"{row['instructions']:>9}{cpi:>8}{expected:>8}"
+                + "".join(f"{row['states'].get(STATES[s], 0):>8}" for s in used)
+            )
+        lines.append("")
+        lines.extend(f"{s:>4}  {STATES[s]}" for s in used)
+        lines.append("")
+        lines.append(f"{'mode':<8}{'count':>9}{'cpi':>8}")
+        for mode, row in sorted(report["modes"].items()):
+            cpi = f"{row['cpi']:.2f}" if row["cpi"] is not None else "-"
+            lines.append(f"{mode:<8}{row['instructions']:>9}{cpi:>8}")
+        return "\n".join(lines) + "\n"
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
+        with open(os.path.splitext(path)[0] + ".txt", "w") as f:
+            f.write(self.table())
+
+
+# CPI_PROFILE=<file.json> in the Makefile (see helper.INSTRUMENTS): one
+# profile for the whole run, its totals so far written to the file, with the
+# table next to it, at the end of every test
+_profile = CPIProfile()
+
+
+def start_instrument(dut, path, test):
+    _profile.start(dut, path)
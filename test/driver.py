@@ -0,0 +1,167 @@
+from cocotb.triggers import FallingEdge, ReadOnly, Timer
+
+import backdoor
+
+
+class Driver:
+    # scripted bus driver for the tt_um_6502 pins, for tests that want to
+    # check every access of an instruction rather than run a whole program.
+    #
+    # the bus is read the same way memory.Memory reads it: in the middle of
+    # each clk_cpu phase (the falling edge of clk, when nothing in the design
+    # moves), taking the address high byte and write data from the high phase
+    # and the low byte and rw from the low phase after it. an access is
+    # therefore (high phase, low phase), and every method covers whole accesses.
+    #
+    # checks only fail in a low phase: what is seen in a high phase is
+    # asserted once the low phase after it has been reached. a failed check
+    # so leaves clk_cpu low, where reset_cpu (and restart() after it) expect
+    # the cpu to be, and the vector or test after it starts in step.
+    #
+    # to keep the per cycle cost down the pin handles and triggers are looked
+    # up once, a pin is only read when something is checked against it, runs
+    # of unchecked phases are waited out with a single Timer, and uio_in is
+    # written immediately (nothing samples it mid-phase) so writes don't need
+    # a ReadWrite callback. only the first wait after restart() is on the clk
+    # edge; after that a Timer of whole clk periods lands mid-phase again.
+
+    def __init__(self, dut, clock_period_ns=1000):
+        self.dut = dut
+        self.uo_out = dut.uo_out
+        self.uio_out = dut.uio_out
+        self.uio_oe = dut.uio_oe
+        self.uio_in = dut.uio_in
+        self._edge = FallingEdge(dut.clk)
+        self._period = clock_period_ns
+        self._timers = {}
+        self.restart()
+
+    def restart(self, page=0):
+        # call after anything else has been waiting on the clock, e.g. a
+        # reset. the cpu has to be at the start of the low phase of an access
+        # to page `page`, whose high phase has been missed
+        self.page = page
+        self._missed_high = True
+        self._in_low = False  # in the low phase of the next access already
+        self._synced = False
+        self._ahead = 0  # phases until the high phase of the next access
+
+    async def _wait(self, phases):
+        if not phases:
+            return
+        if not self._synced:
+            await self._edge
+            self._synced = True
+            phases -= 1
+            if not phases:
+                return
+        timer = self._timers.get(phases)
+        if timer is None:
+            timer = self._timers[phases] = Timer(phases * self._period, units="ns")
+        await timer
+
+    async def _high(self):
+        # go to the high phase of the next access and take its page. returns
+        # False if that phase was missed, in which case the page is assumed
+        if self._missed_high:
+            self._missed_high = False
+            return False
+        await self._wait(self._ahead)
+        self._ahead = 0
+        self.page = self.uo_out.value.integer
+        return True
+
+    async def _low(self, addr):
+        if self._in_low:
+            self._in_low = False
+        else:
+            await self._wait(1)
+        self._ahead = 1
+        if addr is not None:
+            got = (self.page << 8) | self.uo_out.value.integer
+            assert got == addr, f"expected an access to {addr:04x}, got {got:04x}"
+        return self.uio_out.value.integer & 1
+
+    async def read(self, addr, value):
+        # one read access: check its address (None to skip) and answer it
+        await self._high()
+        rw = await self._low(addr)
+        assert rw == 1, f"expected a read, got a write to page {self.page:02x}"
+        self.uio_in.setimmediatevalue(value)
+
+    async def write(self, addr, value):
+        # one write access: check its address and the value written
+        error = None
+        if await self._high():
+            data = self.uio_out.value.integer
+            if self.uio_oe.value.integer != 0xFF:
+                error = "uio is not driven for a write"
+            elif data != value:
+                error = f"wrote {data:02x}, expected {value:02x}"
+        rw = await self._low(addr)
+        assert rw == 0, f"expected a write to {addr:04x}, got a read"
+        assert error is None, error
+
+    async def idle(self, accesses, page=None):
+        # let accesses go by unchecked, apart from the page of the first one.
+        # unless the page is checked nothing is awaited here, the wait is
+        # folded into the next access
+        if page is not None:
+            seen = await self._high()
+            if self.page != page:
+                if seen:
+                    await self._wait(1)
+                    self._ahead = 1
+                raise AssertionError(f"expected page {page:02x}, got {self.page:02x}")
+        self._missed_high = False
+        self._in_low = False
+        self._ahead += 2 * accesses
+
+    async def _boundary(self):
+        # go to the middle of the low phase before the next access, the last
+        # state of the instruction before it. returns False right after
+        # restart(), when that low phase has only just started
+        if self._missed_high:
+            return False
+        await self._wait(self._ahead - 1)
+        self._ahead = 1
+        return True
+
+    async def _fetch(self):
+        # go on to the middle of the low phase of the next access, the last
+        # state of the instruction before it, where the next opcode is
+        # fetched. the registers that instruction loads are written as this
+        # phase starts. returns False if it is there already, or right after
+        # restart(), when that low phase has only just started
+        if self._missed_high:
+            return False
+        await self._high()
+        await self._wait(1)
+        self._missed_high = True
+        self._in_low = True
+        self._ahead = -1
+        return True
+
+    async def deposit(self, **values):
+        # set registers for the next instruction through backdoor.deposit.
+        # they are deposited while its opcode is fetched, after the last
+        # instruction has written its own, apart from pc: the fetch is from
+        # pc, so that goes in the low phase before it. right after restart()
+        # the registers have been written for this cycle already, so it is
+        # all made straight away and a new pc also moves the page
+        pc = values.pop("pc", None)
+        if pc is not None:
+            if self._in_low:
+                raise ValueError("pc can only be deposited before registers()")
+            if not await self._boundary():
+                self.page = pc >> 8
+            backdoor.deposit(self.dut, pc=pc)
+        await self._fetch()
+        backdoor.deposit(self.dut, **values)
+
+    async def registers(self, *names):
+        # the registers (all of them, or the ones named) as the last
+        # instruction left them, read at the same point deposit() writes
+        if not await self._fetch():
+            await ReadOnly()
+        return backdoor.read_state(self.dut, names or backdoor.REGISTERS)
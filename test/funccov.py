@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""Functional coverage of the decoder: what the tests actually made it do.
+
+    python funccov.py report coverage.json
+    python funccov.py merge -o coverage.json sim_build/*/coverage.json
+
+Run the tests with FUNC_COVERAGE=coverage.json to collect it (RTL only).
+Every bin is a bit, so files from any number of runs or shards merge by
+OR-ing them together; a run adds to a coverage file that is already there.
+
+The holes reported are the instructions in inc/opcode.vh that never ran,
+decoder states never reached, STATE -> NEXT_STATE arcs in
+instruction_decode.v never taken, ALU ops the decoder uses that never ran,
+and flag results those ops never produced.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+import cocotb
+from cocotb.triggers import FallingEdge
+
+import opcodes
+from cpi import OPCODE_NAMES, S_OPCODE_READ, STATES, mode_name
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# the bins, sampled once per clk_cpu cycle like cpi.CPIProfile does:
+#   state  (opcode << 4) | STATE, which also gives opcode and mode coverage
+#   arc    (OPCODE[4:2] << 8) | (STATE << 4) | next STATE, keyed by the mode
+#          of the instruction that took the arc
+#   alu    (ALU_op << 3) | (N << 2) | (Z << 1) | C of the ALU flags output,
+#          only for ops that set the flags
+BINS = {"state": 256 * 16, "arc": 8 * 16 * 16, "alu": 32 * 8}
+
+
+def _read(path):
+    with open(os.path.join(HERE, path)) as f:
+        return f.read()
+
+
+def _arcs(source):
+    # STATE -> NEXT_STATE pairs assigned inside the case(STATE) of the
+    # decoder. staying in a state isn't an arc here
+    arcs = set()
+    state = None
+    for line in source[source.index("case(STATE)") :].splitlines():
+        label = re.match(r"\s*(S_\w+)\s*:", line)
+        if label:
+            state = label.group(1)
+        elif re.match(r"\s*default\s*:", line):
+            state = None
+        for target in re.findall(r"NEXT_STATE\s*=\s*(S_\w+)", line):
+            if state is not None:
+                arcs.add((state, target))
+        if re.match(r"\s*endcase", line):
+            break
+    return arcs
+
+
+_DECODE = _read("../src/instruction_decode.v")
+STATE_VALUES = {name: value for value, name in STATES.items()}
+ARCS = {(STATE_VALUES[a], STATE_VALUES[b]) for a, b in _arcs(_DECODE)}
+
+ALU_OPS = {value: name for name, value in opcodes.ALU_OPS.items()}
+_ALU_VALUES = opcodes.ALU_OPS
+ALU_USED = {_ALU_VALUES[n] for n in re.findall(r"alu_enable\s*=\s*`(\w+)", _DECODE)}
+
+# NOP and TMX leave the flags alone. AND, INC and FLG don't touch the carry
+# (see test_alu.py), so only the shifts and rotates have to produce both
+ALU_NO_FLAGS = {_ALU_VALUES["NOP"], _ALU_VALUES["TMX"]}
+ALU_CARRY = {_ALU_VALUES[n] for n in ("ASL", "LSR", "ROL", "ROR")}
+FLAG_BITS = {"N": 2, "Z": 1, "C": 0}
+
+
+def _pack(bins):
+    # a bitmap as a hex number, bin 0 in the lowest bit
+    return f"{sum(1 << i for i, hit in enumerate(bins) if hit):x}"
+
+
+class Coverage:
+    def __init__(self):
+        self.bins = {name: bytearray(size) for name, size in BINS.items()}
+        self._task = None
+
+    def start(self, dut, path=None):
+        # with a path everything so far is merged into that file when the
+        # test ends
+        if self._task is None:
+            self._task = cocotb.start_soon(self._run(dut, path))
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    async def _run(self, dut, path):
+        project = dut.user_project
+        decode = project.instructionDecode
+        state = decode.STATE
+        opcode = decode.OPCODE
+        alu_op = project.ALU_op
+        alu_flags = project.ALU_flags_output
+        rst_n = dut.rst_n
+        edge = FallingEdge(project.clk_cpu)
+        state_bins = self.bins["state"]
+        arc_bins = self.bins["arc"]
+        alu_bins = self.bins["alu"]
+        no_flags = ALU_NO_FLAGS
+
+        # OPCODE only changes on entering S_OPCODE_READ (or in reset), so it
+        # is only read then. the ALU flags are only read for ops that set them
+        op = None
+        last = None
+        try:
+            while True:
+                await edge
+                reset = rst_n.value
+                if not (reset.is_resolvable and reset.integer):
+                    op = last = None
+                    continue
+                s = state.value.integer
+                if op is None or s == S_OPCODE_READ:
+                    op = opcode.value.integer
+                state_bins[(op << 4) | s] = 1
+                if last is not None:
+                    arc_bins[last | s] = 1
+                last = ((op & 0b11100) << 6) | (s << 4)
+
+                a = alu_op.value.integer
+                if a not in no_flags:
+                    f = alu_flags.value.integer
+                    alu_bins[(a << 3) | ((f >> 4) & 4) | (f & 3)] = 1
+        finally:
+            # the test gets killed at its end, which closes this coroutine
+            self._task = None
+            if path:
+                self.merge(load(path)).save(path)
+
+    def merge(self, other):
+        if other is not None:
+            for name, bins in self.bins.items():
+                for i, hit in enumerate(other.bins[name]):
+                    if hit:
+                        bins[i] = 1
+        return self
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(
+                {name: _pack(bins) for name, bins in self.bins.items()},
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+
+    def holes(self):
+        state = self.bins["state"]
+        arc = self.bins["arc"]
+        alu = self.bins["alu"]
+        ran = {op for op in range(256) if state[(op << 4) | S_OPCODE_READ]}
+        reached = {i & 0xF for i, hit in enumerate(state) if hit}
+        taken = {((i >> 4) & 0xF, i & 0xF) for i, hit in enumerate(arc) if hit}
+
+        flags = {}
+        for op in ALU_USED - ALU_NO_FLAGS:
+            seen = [i & 7 for i in range(op << 3, (op + 1) << 3) if alu[i]]
+            missing = [
+                f"{flag}={value}"
+                for flag, bit in FLAG_BITS.items()
+                if flag != "C" or op in ALU_CARRY
+                for value in (0, 1)
+                if not any((v >> bit) & 1 == value for v in seen)
+            ]
+            if missing:
+                flags[ALU_OPS[op]] = missing
+
+        return {
+            "opcodes": sorted(
+                f"{op:02x} {name}" for op, name in OPCODE_NAMES.items() if op not in ran
+            ),
+            "states": sorted(name for s, name in STATES.items() if s not in reached),
+            "arcs": sorted(
+                f"{STATES[a]} -> {STATES[b]}" for a, b in ARCS if (a, b) not in taken
+            ),
+            "unexpected_arcs": sorted(
+                f"{STATES.get(a, a)} -> {STATES.get(b, b)}"
+                for a, b in taken
+                if a != b and (a, b) not in ARCS
+            ),
+            "alu_ops": sorted(
+                ALU_OPS[op]
+                for op in ALU_USED
+                if not any(alu[op << 3 : (op + 1) << 3]) and op not in ALU_NO_FLAGS
+            ),
+            "alu_flags": flags,
+        }
+
+    def summary(self):
+        state = self.bins["state"]
+        arc = self.bins["arc"]
+        ran = {op for op in range(256) if state[(op << 4) | S_OPCODE_READ]}
+        modes = {}
+        for op in sorted(ran):
+            mode = mode_name(op)
+            modes.setdefault(mode, []).append(OPCODE_NAMES.get(op, f"{op:02x}"))
+        taken = {((i >> 4) & 0xF, i & 0xF) for i, hit in enumerate(arc) if hit}
+        return {
+            "opcodes": (len(ran & set(OPCODE_NAMES)), len(OPCODE_NAMES)),
+            "states": (
+                len({i & 0xF for i, hit in enumerate(state) if hit}),
+                len(STATES),
+            ),
+            "arcs": (len(taken & ARCS), len(ARCS)),
+            "modes": modes,
+        }
+
+
+def load(path):
+    # None if there is no coverage there yet
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    cov = Coverage()
+    for name, bins in cov.bins.items():
+        value = int(data.get(name, "0"), 16)
+        for i in range(len(bins)):
+            bins[i] = (value >> i) & 1
+    return cov
+
+
+# FUNC_COVERAGE=<file.json> in the Makefile (see helper.INSTRUMENTS): the bins
+# of the whole run, merged into the file at the end of every test
+_coverage = Coverage()
+
+
+def start_instrument(dut, path, test):
+    _coverage.start(dut, path)
+
+
+def report(cov):
+    summary = cov.summary()
+    for name in ("opcodes", "states", "arcs"):
+        hit, total = summary[name]
+        print(f"{name:<8} {hit:>4}/{total:<4}")
+    for mode, names in sorted(summary["modes"].items()):
+        print(f"  {mode:<6} {' '.join(names)}")
+
+    holes = cov.holes()
+    for name, missing in holes.items():
+        if not missing:
+            continue
+        print(f"\n{name.replace('_', ' ')} not covered:")
+        if isinstance(missing, dict):
+            for op, flags in sorted(missing.items()):
+                print(f"  {op}: {' '.join(flags)}")
+        else:
+            for item in missing:
+                print(f"  {item}")
+    return holes
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("report")
+    p.add_argument("coverage")
+    p.add_argument(
+        "--fail-on-holes", action="store_true", help="exit with 1 if anything is missed"
+    )
+    p = sub.add_parser("merge")
+    p.add_argument("-o", "--output", required=True)
+    p.add_argument("inputs", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "merge":
+        merged = Coverage()
+        for path in args.inputs:
+            cov = load(path)
+            if cov is None:
+                print(f"skipping {path}, no coverage there")
+            merged.merge(cov)
+        merged.save(args.output)
+        return 0
+
+    cov = load(args.coverage)
+    if cov is None:
+        print(f"no coverage in {args.coverage}")
+        return 1
+    holes = report(cov)
+    return 1 if args.fail_on_holes and any(holes.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,130 +1,233 @@
-from cocotb.triggers import ClockCycles
+import contextlib
+import importlib
+import json
+import os
+import random
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import ClockCycles, RisingEdge, Timer
+
+from driver import Driver
+from opcodes import OP
 
 
 def hex_to_num(hex_string):
-    vals = {
-        "0": 0,
-        "1": 1,
-        "2": 2,
-        "3": 3,
-        "4": 4,
-        "5": 5,
-        "6": 6,
-        "7": 7,
-        "8": 8,
-        "9": 9,
-        "a": 10,
-        "b": 11,
-        "c": 12,
-        "d": 13,
-        "e": 14,
-        "f": 15,
-    }
-    return vals[hex_string[0]] * 16 + vals[hex_string[1]]
+    return int(hex_string[:2], 16)
 
 
-async def reset_cpu(dut):
+# the clk period the tests are written for. with +clk_period_ns tb.v runs
+# the clock itself and the period comes from there (plusargs is None when
+# this is imported outside a simulation)
+_plusargs = cocotb.plusargs or {}
+CLK_PERIOD_NS = int(_plusargs.get("clk_period_ns", 1000))
+HDL_CLOCK = "clk_period_ns" in _plusargs
+
+# GATES=yes in the Makefile: the design is the gate level netlist, which has
+# none of the rtl's internal names, so the tests stick to the pins there
+GATES = os.environ.get("GATES") == "yes"
+
+
+# optional instruments, each switched on by an environment variable and
+# documented in its own module. a module is only imported once its variable
+# is set, and then its start_instrument(dut, setting, test) is called at the
+# start of every test with the value of the variable
+INSTRUMENTS = {
+    "PY_PROFILE": "pyprofile",
+    "TRACE_RECORD": "bustrace",
+    "CPI_PROFILE": "cpi",
+    "FUNC_COVERAGE": "funccov",
+    "VECTOR_COVERAGE": "vectorset",
+}
+_instruments = {}  # variable -> module, of the ones switched on
+
+
+def start_clock(dut):
+    # every test starts with this, and it is the one place that decides where
+    # clk comes from: a cocotb Clock, or tb.v itself (HDL_CLOCK=1 in the
+    # Makefile) in which case there is nothing to start. it also starts the
+    # INSTRUMENTS that are switched on.
+    #
+    # random is reseeded from RANDOM_SEED and the name of the test, so what a
+    # test draws doesn't depend on the tests that ran before it and a single
+    # test rerun with the same RANDOM_SEED (replay.py, vectorset.py run,
+    # incremental.py) gets the same values as in the full run
+    test = _test_name()
+    random.seed(f"{cocotb.RANDOM_SEED}:{test}")
+
+    if not HDL_CLOCK:
+        clock = Clock(dut.clk, CLK_PERIOD_NS, units="ns")
+        cocotb.start_soon(clock.start())
+
+    for variable, name in INSTRUMENTS.items():
+        setting = os.environ.get(variable)
+        if not setting:
+            continue
+        if variable not in _instruments:
+            _instruments[variable] = importlib.import_module(name)
+        _instruments[variable].start_instrument(dut, setting, test)
+
+
+async def clock_cycles(dut, cycles):
+    # ClockCycles(dut.clk, cycles) with only two clk edges going through the
+    # GPI: catch the next rising edge, sleep until half a period before the
+    # last one and catch that
+    if cycles <= 3:
+        await ClockCycles(dut.clk, cycles)
+        return
+    await RisingEdge(dut.clk)
+    await Timer((cycles - 1) * CLK_PERIOD_NS - CLK_PERIOD_NS // 2, units="ns")
+    await RisingEdge(dut.clk)
+
+
+async def hold_reset(dut):
     dut.ena.value = 1
     dut.ui_in.value = 0
-    dut.uio_in.value = 0
     dut.rst_n.value = 0
-    await ClockCycles(dut.clk, 10)
+    await clock_cycles(dut, 10)
     dut.rst_n.value = 1
 
+
+async def reset_cpu(dut):
+    dut.uio_in.value = 0
+    await hold_reset(dut)
+
     # now we run a nop so that our pc actually increments
     dut.uio_in.value = hex_to_num("ea")
     await ClockCycles(dut.clk, 2)
     dut.uio_in.value = 0
     await ClockCycles(dut.clk, 2)
 
+    # the cpu is now about to fetch from $0001
+    driver(dut).restart(page=0)
+
+
+# replaying one failing vector (see replay.py). a test that runs vectors
+# skips every one but REPLAY_VECTOR, or the ones from REPLAY_FROM to it when
+# it depends on the ones before it since the last reset. the skipped vectors
+# are still generated, and start_clock seeds random per test, so with the
+# RANDOM_SEED of the failing run the random ones come out the same even when
+# the test ran after others there. every failing vector of a normal run is
+# appended to FAILURES with the seed, as the arguments replay.py needs.
+# VECTOR_LIST=<file.json> (from vectorset.py select) likewise skips every
+# vector of a test except the ones listed for it
+_replay = os.environ.get("REPLAY_VECTOR")
+REPLAY_VECTOR = None if _replay is None else int(_replay)
+REPLAY_FROM = int(os.environ.get("REPLAY_FROM") or REPLAY_VECTOR or 0)
+FAILURES = os.environ.get("FAILURES", "failures.jsonl")
+
+_vector_list = None
+if os.environ.get("VECTOR_LIST"):
+    with open(os.environ["VECTOR_LIST"]) as _f:
+        _vector_list = {
+            name: set(test["vectors"]) for name, test in json.load(_f)["tests"].items()
+        }
+
+
+def skip_vector(index):
+    if _vector_list is not None:
+        return index not in _vector_list.get(_test_name(), ())
+    return REPLAY_VECTOR is not None and not REPLAY_FROM <= index <= REPLAY_VECTOR
+
+
+def _test_name():
+    test = getattr(cocotb.regression_manager, "_test", None)
+    return getattr(test, "name", "unknown")
+
+
+@contextlib.contextmanager
+def vector(dut, index, first=None):
+    # wrap running vector index with this. first is the vector the cpu was
+    # last reset before, if not this one. when replaying, tb.v only dumps
+    # while the vector runs (the +dump_window the Makefile adds), and with
+    # VECTOR_COVERAGE the coverage of a vector that passes is recorded
+    window = index == REPLAY_VECTOR
+    if window:
+        dut.dump_window.value = 1
+    coverage = _instruments.get("VECTOR_COVERAGE")
+    if coverage:
+        coverage.begin_vector(_test_name(), index)
+    try:
+        yield
+        if coverage:
+            coverage.end_vector()
+    except AssertionError:
+        if REPLAY_VECTOR is None:
+            failure = {
+                "test": _test_name(),
+                "seed": cocotb.RANDOM_SEED,
+                "vector": index,
+                "from": index if first is None else first,
+            }
+            multi = ""
+            if os.environ.get("MULTI"):
+                # from test_multi.py, where the vectors before it since the
+                # reset were only the ones of the same cpu
+                failure["multi"] = int(os.environ["MULTI"])
+                multi = f" --multi {failure['multi']}"
+            with open(FAILURES, "a") as f:
+                f.write(json.dumps(failure) + "\n")
+            dut._log.error(
+                f"replay with: python replay.py --test {failure['test']} "
+                f"--seed {failure['seed']} --vector {index} --from {failure['from']}"
+                + multi
+            )
+        raise
+    finally:
+        if window:
+            dut.dump_window.value = 0
+
+
+def driver(dut):
+    # one Driver per dut (or per cpu of tb_multi, see test_multi.py), so its
+    # handles and triggers are only set up once
+    bus = _drivers.get(id(dut))
+    if bus is None or bus.dut is not dut:
+        bus = _drivers[id(dut)] = Driver(dut, CLK_PERIOD_NS)
+    return bus
+
+
+_drivers = {}
+
+
+def pc_accesses(starting_PC, length, enable_pc_checks=True):
+    # addresses the pins show for the opcode and operand fetches. the pc
+    # steps between the high and low phase of an operand fetch, so its high
+    # byte is still the one from before
+    if not enable_pc_checks:
+        return [None] * length
+    return [starting_PC] + [
+        ((starting_PC + i - 1) & 0xFF00) | ((starting_PC + i) & 0xFF)
+        for i in range(1, length)
+    ]
+
 
 async def test_zpg_instruction(
     dut, opcode, addr_LB, starting_PC, input_value, output_value, enable_pc_checks=True
 ):
-    # feed in the opcode
-    dut.uio_in.value = opcode
-    await ClockCycles(dut.clk, 1)
-    if enable_pc_checks:
-        assert dut.uo_out.value == starting_PC
-    assert dut.uio_out.value % 2 == 1  # last bit should be 1 for read
-    await ClockCycles(dut.clk, 1)
-    assert dut.uo_out.value == 0
-
-    # feed in the addr to read from
-    dut.uio_in.value = addr_LB
-    await ClockCycles(dut.clk, 1)
-    if enable_pc_checks:
-        assert dut.uo_out.value == starting_PC + 1
-    assert dut.uio_out.value % 2 == 1  # last bit should be 1 for read
-    await ClockCycles(dut.clk, 1)
-    assert dut.uo_out.value == 0
-
-    # feed in the data we want to operate on
-    dut.uio_in.value = input_value
-    await ClockCycles(dut.clk, 1)
-    assert dut.uo_out.value == addr_LB
-    await ClockCycles(dut.clk, 1)
-    assert dut.uo_out.value == 0  # this shouldn't change though
-
-    # wait for the ALU to get the data
-    dut.uio_in.value = hex_to_num("00")
-    await ClockCycles(dut.clk, 1)
-    await ClockCycles(dut.clk, 1)
-
-    # wait for data bus buffer to get the data
-    dut.uio_in.value = hex_to_num("00")
-    await ClockCycles(dut.clk, 1)
-    await ClockCycles(dut.clk, 1)
-
-    await ClockCycles(dut.clk, 1)
-    await ClockCycles(dut.clk, 1)
-    assert dut.uio_out.value == output_value  # check the value
-    assert dut.uio_oe.value == hex_to_num("ff")  # check if we are outputting
-    assert dut.uo_out.value == 0  # check the page we are writing to
-
-    await ClockCycles(dut.clk, 1)
-    assert dut.uio_out.value % 2 == 0  # last bit should be 0 for write
-    assert dut.uo_out.value == addr_LB  # check the mem addr we are writing to
-    await ClockCycles(dut.clk, 1)
+    bus = driver(dut)
+    fetch = pc_accesses(starting_PC, 2, enable_pc_checks)
+
+    await bus.read(fetch[0], opcode)
+    await bus.read(fetch[1], addr_LB)
+    await bus.read(addr_LB, input_value)  # the data we want to operate on
+
+    # the alu and then the data bus buffer get the data, back on the pc page
+    await bus.idle(3, page=(starting_PC + 2) // 256)
+
+    await bus.write(addr_LB, output_value)
 
 
 async def run_input_zpg_instruction(
     dut, opcode, addr_LB, starting_PC, input_value, enable_pc_checks=True
 ):
-    # feed in the opcode
-    dut.uio_in.value = opcode
-    await ClockCycles(dut.clk, 1)
-    if enable_pc_checks:
-        assert dut.uo_out.value == starting_PC
-    assert dut.uio_out.value % 2 == 1  # last bit should be 1 for read
-    await ClockCycles(dut.clk, 1)
-    assert dut.uo_out.value == 0
-
-    # feed in the addr to read from
-    dut.uio_in.value = addr_LB
-    await ClockCycles(dut.clk, 1)
-    if enable_pc_checks:
-        assert dut.uo_out.value == starting_PC + 1
-    assert dut.uio_out.value % 2 == 1  # last bit should be 1 for read
-    await ClockCycles(dut.clk, 1)
-    assert dut.uo_out.value == 0
-
-    # feed in the data we want to operate on
-    dut.uio_in.value = input_value
-    await ClockCycles(dut.clk, 1)
-    assert dut.uo_out.value == addr_LB
-    await ClockCycles(dut.clk, 1)
-    assert dut.uo_out.value == 0  # this shouldn't change though
-
-    # wait
-    dut.uio_in.value = hex_to_num("00")
-    await ClockCycles(dut.clk, 1)
-    await ClockCycles(dut.clk, 1)
-
-    # wait
-    dut.uio_in.value = hex_to_num("00")
-    await ClockCycles(dut.clk, 1)
-    await ClockCycles(dut.clk, 1)
+    bus = driver(dut)
+    fetch = pc_accesses(starting_PC, 2, enable_pc_checks)
+
+    await bus.read(fetch[0], opcode)
+    await bus.read(fetch[1], addr_LB)
+    await bus.read(addr_LB, input_value)
+    await bus.idle(2, page=(starting_PC + 2) // 256)
 
 
 async def run_abs_instruction(
@@ -137,57 +240,120 @@ async def run_abs_instruction(
     output_value,
     enable_pc_checks=True,
 ):
-    # feed in the opcode
-    dut.uio_in.value = opcode
-    await ClockCycles(dut.clk, 1)
-    if enable_pc_checks:
-        assert dut.uo_out.value == starting_PC
-    assert dut.uio_out.value % 2 == 1  # last bit should be 1 for read
-    await ClockCycles(dut.clk, 1)
-    assert dut.uo_out.value == 0
-
-    # feed in the addr_LB to read from
-    dut.uio_in.value = addr_LB
-    await ClockCycles(dut.clk, 1)
-    if enable_pc_checks:
-        assert dut.uo_out.value == starting_PC + 1
-    assert dut.uio_out.value % 2 == 1  # last bit should be 1 for read
-    await ClockCycles(dut.clk, 1)
-    assert dut.uo_out.value == 0
-
-    # feed in the addr_HB to read from
-    dut.uio_in.value = addr_HB
-    await ClockCycles(dut.clk, 1)
-    if enable_pc_checks:
-        assert dut.uo_out.value == starting_PC + 2
-    assert dut.uio_out.value % 2 == 1  # last bit should be 1 for read
-    await ClockCycles(dut.clk, 1)
-    assert dut.uo_out.value == addr_HB
-
-    # feed in the data we want to operate on
-    dut.uio_in.value = input_value
-    await ClockCycles(dut.clk, 1)
-    assert dut.uo_out.value == addr_LB
-    await ClockCycles(dut.clk, 1)
-    assert dut.uo_out.value == 0  # this shouldn't change though
-
-    # wait for the ALU to get the data
-    dut.uio_in.value = hex_to_num("00")
-    await ClockCycles(dut.clk, 1)
-    await ClockCycles(dut.clk, 1)
-
-    # wait for data bus buffer to get the data
-    dut.uio_in.value = hex_to_num("00")
-    await ClockCycles(dut.clk, 1)
-    await ClockCycles(dut.clk, 1)
-
-    await ClockCycles(dut.clk, 1)
-    await ClockCycles(dut.clk, 1)
-    assert dut.uio_out.value == output_value  # check the value
-    assert dut.uio_oe.value == hex_to_num("ff")  # check if we are outputting
-    assert dut.uo_out.value == addr_HB  # check the page we are writing to
-
-    await ClockCycles(dut.clk, 1)
-    assert dut.uio_out.value % 2 == 0  # last bit should be 0 for write
-    assert dut.uo_out.value == addr_LB  # check the mem addr we are writing to
-    await ClockCycles(dut.clk, 1)
+    bus = driver(dut)
+    fetch = pc_accesses(starting_PC, 3, enable_pc_checks)
+    addr = (addr_HB << 8) | addr_LB
+
+    await bus.read(fetch[0], opcode)
+    await bus.read(fetch[1], addr_LB)
+    await bus.read(fetch[2], addr_HB)
+    await bus.read(addr, input_value)  # the data we want to operate on
+
+    # the alu and then the data bus buffer get the data, back on the pc page
+    await bus.idle(3, page=(starting_PC + 3) // 256)
+
+    await bus.write(addr, output_value)
+
+
+async def stream_vectors(dut, vectors, indices=None):
+    # run (opcode, operands, input_value, output_value) vectors back to
+    # back after a single reset. operands is (addr_LB,) for zero page or
+    # (addr_LB, addr_HB) for absolute, and an output_value of None means
+    # the instruction only reads. a vector can have a fifth item, a dict of
+    # registers to deposit before its opcode fetch (see backdoor.py, or
+    # loaded from its zero page address at gate level), and a sixth, a dict
+    # of the registers expected once it has finished (stored back there at
+    # gate level). the cpu only gets reset again after a mismatch, and
+    # every failing vector is reported before the test fails. indices
+    # numbers the vectors, if they are a share of a longer list.
+    # a reset_cpu is 14 clk periods, about as long as a zero page vector,
+    # so leaving it out halves the simulated time of a _Base test: 7.17 ms
+    # -> 3.60 ms for a zero page one and 7.68 ms -> 4.11 ms for an absolute
+    # one at the default clk
+    await reset_cpu(dut)
+    pc = 1
+    first = 0  # the first vector since the last reset
+    failures = []
+
+    numbered = enumerate(vectors) if indices is None else zip(indices, vectors)
+    for index, (opcode, operands, input_value, output_value, *registers) in numbered:
+        if skip_vector(index):
+            continue
+        before = registers[0] if registers else None
+        after = registers[1] if len(registers) > 1 else None
+        try:
+            with vector(dut, index, first):
+                pc = await _run_vector(
+                    dut, opcode, operands, input_value, output_value, pc, before, after
+                )
+        except AssertionError as e:
+            dut._log.error(
+                f"vector {index} failed: opcode {opcode:02x} operands {operands} "
+                f"input {input_value} expected {output_value} ({e})"
+            )
+            failures.append(index)
+            await reset_cpu(dut)
+            pc = 1
+            first = index + 1
+
+    assert not failures, f"{len(failures)} vectors failed: {failures}"
+
+
+async def _run_vector(
+    dut, opcode, operands, input_value, output_value, pc, before, after
+):
+    # returns the pc after the vector
+    if before and GATES:
+        for name, value in before.items():
+            if name not in _LOAD:
+                raise ValueError(f"{name} can't be set at gate level")
+            await run_input_zpg_instruction(dut, _LOAD[name], operands[0], pc, value)
+            pc += 2
+    elif before:
+        await driver(dut).deposit(**before)
+    if len(operands) == 2:
+        await run_abs_instruction(
+            dut,
+            opcode,
+            operands[1],
+            operands[0],
+            pc,
+            input_value,
+            output_value,
+        )
+    elif output_value is None:
+        await run_input_zpg_instruction(dut, opcode, operands[0], pc, input_value)
+    else:
+        await test_zpg_instruction(
+            dut, opcode, operands[0], pc, input_value, output_value
+        )
+    pc += 1 + len(operands)
+    if after and GATES:
+        # stored back to the zero page address to be seen on the bus. the
+        # flags can't be, so p goes unchecked
+        for name, value in after.items():
+            if name in _STORE:
+                await test_zpg_instruction(dut, _STORE[name], operands[0], pc, 0, value)
+                pc += 2
+    elif after:
+        got = await driver(dut).registers(*after)
+        assert got == after, f"registers {got}, expected {after}"
+    return pc
+
+
+# at gate level a vector's registers go in with a load from its zero page
+# address and come out with a store to it, as the backdoor can't reach them
+_LOAD = {"a": OP.LD_A_ZPG, "x": OP.LD_X_ZPG, "y": OP.LD_Y_ZPG}
+_STORE = {"a": OP.ST_A_ZPG, "x": OP.ST_X_ZPG, "y": OP.ST_Y_ZPG}
+
+
+async def run_program(dut, memory, program):
+    # the cpu starts fetching from address 0 once it leaves reset
+    memory.load(program)
+    memory.start()
+    await hold_reset(dut)
+
+    # unwritten memory decodes as a no-op, so the cpu slides past the end of
+    # the program; a read one past the end means the last instruction has
+    # finished (including its write back)
+    await memory.wait_for_read(len(program) + 1)
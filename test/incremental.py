@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""Only rerun the tests whose inputs changed since they last passed.
+
+    python incremental.py                    # test.py, RTL
+    python incremental.py --all              # everything, and record it
+    python incremental.py --dry-run          # what would run, and why
+    python incremental.py GATES=yes          # extra arguments go to make
+    python incremental.py --module test_alu
+
+Every test gets a key made of
+    rtl   the Verilog the module simulates and everything it `includes, the
+          simulator and the cocotb version (the same hash as build_cache.py)
+    code  the test function and every function, class and constant it uses
+          in test.py and helper.py, and any other module here they use as a
+          whole file, with the modules that one imports
+    args  the make arguments
+    seed  RANDOM_SEED, for tests that use the random module
+and a test is skipped when its key is the one recorded the last time it
+passed. Tests that fail are always rerun.
+
+What a random test draws is only down to its own name and RANDOM_SEED if
+helper.start_clock seeds random for it. Otherwise it depends on the tests that
+ran before it in the same simulation, so a random test that doesn't go
+through start_clock is never skipped.
+
+Random tests are only repeatable with a fixed seed, so the runs share one:
+RANDOM_SEED=<n> as an argument, otherwise the one recorded in the state file
+(a new one is picked with --reseed, or the first time). The results go to
+results.xml like a normal run.
+"""
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import random
+import subprocess
+import sys
+import xml.etree.ElementTree as ET
+
+from build_cache import build_key
+from run_shards import find_tests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+
+# what the Makefile simulates for each test module
+MODULES = {
+    "test": ([], ["tb.v", "../src/project.v"]),
+    "test_alu": (["ALU=yes"], ["alu_tb.v", "../src/alu.v"]),
+}
+GL_SOURCES = ["tb.v", "gate_level_netlist.v"]
+
+# modules hashed per function rather than as a whole file
+GRANULAR = {"helper"}
+
+# modules whose use makes a test depend on RANDOM_SEED
+RANDOM = {"random", "randprog"}
+
+# the function that seeds random per test, and what in random doing that uses
+SEEDED_BY = ("helper", "start_clock")
+SEEDING = {("random", "seed")}
+
+KEY_PARTS = ("rtl", "code", "args", "seed")
+
+
+def _hash(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode() + b"\0")
+    return h.hexdigest()
+
+
+class _Module:
+    # one python file here: its top level definitions by name, with their
+    # source, and what its imports bind each name to
+    def __init__(self, name):
+        path = os.path.join(HERE, name + ".py")
+        with open(path) as f:
+            self.text = f.read()
+        tree = ast.parse(self.text)
+        lines = self.text.splitlines()
+
+        self.defs = {}
+        self.imports = {}  # local name -> (module, attribute or None)
+        preamble = []
+        for node in tree.body:
+            start = node.lineno
+            if getattr(node, "decorator_list", None):
+                start = node.decorator_list[0].lineno
+            source = "\n".join(lines[start - 1 : node.end_lineno])
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                self.defs[node.name] = (node, source)
+                continue
+            if isinstance(node, (ast.Assign, ast.AnnAssign)):
+                targets = (
+                    node.targets if isinstance(node, ast.Assign) else [node.target]
+                )
+                names = [t.id for t in targets if isinstance(t, ast.Name)]
+                if names:
+                    for name in names:
+                        self.defs[name] = (node, source)
+                    continue
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    self.imports[alias.asname or alias.name] = (alias.name, None)
+            elif isinstance(node, ast.ImportFrom) and not node.level:
+                for alias in node.names:
+                    self.imports[alias.asname or alias.name] = (node.module, alias.name)
+            # imports and anything else at the top level go with every test
+            preamble.append(source)
+        self.preamble = "\n".join(preamble)
+
+
+class Dependencies:
+    # works out the code key of tests, and whether they are random
+    def __init__(self):
+        self._modules = {}
+
+    def _module(self, name):
+        if name not in self._modules:
+            path = os.path.join(HERE, name + ".py")
+            self._modules[name] = _Module(name) if os.path.isfile(path) else None
+        return self._modules[name]
+
+    def test(self, module, name):
+        # (code hash, uses random, random is seeded per test) for one test
+        # in module
+        self._seen = set()
+        self._parts = []
+        self._random = False
+        self._add_module_preamble(module)
+        self._add_def(module, name)
+        seeded = SEEDED_BY in self._seen
+        return _hash(*sorted(self._parts)), self._random, seeded
+
+    def _add_module_preamble(self, name):
+        key = (name, None)
+        if key in self._seen:
+            return
+        self._seen.add(key)
+        self._parts.append(f"{name}\n{self._module(name).preamble}")
+
+    def _add_file(self, name):
+        # a module used as a whole, with the local modules it imports
+        key = (name, "*")
+        if key in self._seen:
+            return
+        self._seen.add(key)
+        module = self._module(name)
+        self._parts.append(f"{name}\n{module.text}")
+        for target, _ in module.imports.values():
+            self._use(target, None)
+
+    def _use(self, name, attribute):
+        # something from module name was used: attribute of it, or all of it
+        if name in RANDOM and (name, attribute) not in SEEDING:
+            self._random = True
+        module = self._module(name)
+        if module is None:
+            return  # not one of ours
+        if name in GRANULAR and attribute is not None:
+            self._add_module_preamble(name)
+            self._add_def(name, attribute)
+        else:
+            self._add_file(name)
+
+    def _add_def(self, name, attribute):
+        key = (name, attribute)
+        if key in self._seen:
+            return
+        self._seen.add(key)
+        module = self._module(name)
+        if attribute not in module.defs:
+            return
+        node, source = module.defs[attribute]
+        self._parts.append(f"{name}.{attribute}\n{source}")
+
+        for child in ast.walk(node):
+            if isinstance(child, ast.Attribute) and isinstance(child.value, ast.Name):
+                target = module.imports.get(child.value.id)
+                if target is not None and target[1] is None:
+                    self._use(target[0], child.attr)
+            elif isinstance(child, ast.Name):
+                if child.id in module.defs:
+                    self._add_def(name, child.id)
+                elif child.id in module.imports:
+                    target, imported = module.imports[child.id]
+                    if imported is None:
+                        # the module itself, attribute uses are found above
+                        if not self._attribute_only(node, child.id):
+                            self._use(target, None)
+                    else:
+                        self._use(target, imported)
+
+    @staticmethod
+    def _attribute_only(node, name):
+        # True if name is only ever used as name.something inside node
+        parents = {
+            id(child.value)
+            for child in ast.walk(node)
+            if isinstance(child, ast.Attribute)
+        }
+        return all(
+            id(child) in parents
+            for child in ast.walk(node)
+            if isinstance(child, ast.Name) and child.id == name
+        )
+
+
+def rtl_key(module, make_args):
+    args, sources = MODULES[module]
+    if "GATES=yes" in make_args and module == "test":
+        sources = GL_SOURCES
+    sim = "icarus"
+    for arg in make_args:
+        if arg.startswith("SIM="):
+            sim = arg[4:]
+    sources = [os.path.join(HERE, s) for s in sources]
+    return build_key(sim, [f"-I{SRC}"], sources)
+
+
+def test_keys(module, make_args, seed):
+    rtl = rtl_key(module, make_args)
+    args = _hash(module, *make_args)
+    deps = Dependencies()
+    keys = {}
+    for test in find_tests(module):
+        code, uses_random, seeded = deps.test(module, test)
+        test_seed = None
+        if uses_random:
+            # an unseeded test's key is never the same twice, so it always runs
+            test_seed = seed if seeded else f"unseeded {os.urandom(8).hex()}"
+        keys[test] = {
+            "rtl": rtl,
+            "code": code,
+            "args": args,
+            "seed": test_seed,
+        }
+    return keys
+
+
+def load_state(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def why(key, last):
+    # what changed, None if nothing did
+    if last is None:
+        return "new"
+    changed = [part for part in KEY_PARTS if key[part] != last.get(part)]
+    return ", ".join(changed) or None
+
+
+def run(module, tests, make_args, seed, results):
+    args, _ = MODULES[module]
+    cmd = [
+        "make",
+        f"COCOTB_RESULTS_FILE={results}",
+        f"TESTCASE={','.join(tests)}",
+        *args,
+        *make_args,
+    ]
+    env = dict(os.environ, RANDOM_SEED=str(seed))
+    subprocess.run(cmd, cwd=HERE, env=env)
+
+    passed = set()
+    try:
+        root = ET.parse(os.path.join(HERE, results)).getroot()
+    except (OSError, ET.ParseError):
+        root = ET.Element("testsuites")
+    for case in root.iter("testcase"):
+        if not any(
+            case.find(tag) is not None for tag in ("failure", "error", "skipped")
+        ):
+            passed.add(case.get("name"))
+    # a test the simulator never got to counts as failed
+    return passed, set(tests) - passed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--module", choices=MODULES, default="test")
+    parser.add_argument("--all", action="store_true", help="run every test")
+    parser.add_argument("--reseed", action="store_true", help="pick a new seed")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--state", default=os.path.join(HERE, ".incremental.json"))
+    parser.add_argument("--results", default="results.xml")
+    parser.add_argument("make_args", nargs="*", help="e.g. GATES=yes SIM=verilator")
+    args = parser.parse_args()
+
+    state = load_state(args.state)
+    make_args = []
+    seed = None
+    for arg in args.make_args:
+        if arg.startswith("RANDOM_SEED="):
+            seed = int(arg.split("=", 1)[1], 0)
+        else:
+            make_args.append(arg)
+    if seed is None:
+        seed = state.get("seed")
+    if seed is None or args.reseed:
+        seed = random.getrandbits(32)
+
+    keys = test_keys(args.module, make_args, seed)
+    recorded = state.get("tests", {}).get(args.module, {})
+    selected = []
+    for test, key in keys.items():
+        reason = "--all" if args.all else why(key, recorded.get(test))
+        if reason is not None:
+            selected.append(test)
+            print(f"run  {test} ({reason})")
+    skipped = len(keys) - len(selected)
+    print(f"{len(selected)} to run, {skipped} unchanged, seed {seed}")
+    if args.dry_run or not selected:
+        return 0
+
+    passed, failed = run(args.module, selected, make_args, seed, args.results)
+
+    # forget tests that are gone, and anything that didn't pass this time
+    recorded = {t: k for t, k in recorded.items() if t in keys and t not in failed}
+    for test in passed & set(keys):
+        recorded[test] = keys[test]
+    state.setdefault("tests", {})[args.module] = recorded
+    state["seed"] = seed
+    with open(args.state, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+
+    print(f"{len(passed)} passed, {len(failed)} failed, {skipped} skipped")
+    for name in sorted(failed):
+        print(f"  FAIL {name}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+import cocotb
+from cocotb.triggers import Event, FallingEdge
+
+
+class Memory:
+    # 64 KiB memory that sits on the multiplexed bus of tt_um_6502
+    #
+    # every cpu cycle is two clk periods: while clk_cpu is high uo_out has the
+    # address high byte and uio_out has the data being written, while clk_cpu
+    # is low uo_out has the address low byte and uio_out[0] has rw. the cpu
+    # samples uio_in on the clk_cpu edges, so we look at the pins on the falling
+    # edge of clk (the middle of each phase) and answer reads straight away.
+    #
+    # the high byte is taken from the phase before the low byte, exactly as the
+    # pins show it. this means an operand fetch that crosses a page boundary
+    # sees the old page, same as real hardware on these pins would.
+    #
+    # only the pins are used, so this works on the gate level netlist too. the
+    # phase comes from the pins while the cpu is held in reset: the decoder
+    # idles then, reading, so uio_out is rw = 1 while clk_cpu is low and 0
+    # while it is high. it is taken again on every reset, and nothing is
+    # answered until the memory has seen one, so start it before the reset.
+
+    def __init__(self, dut, trace=False):
+        self.dut = dut
+        self.data = bytearray(0x10000)
+        self.writes = []  # (address, value) for every write, in order
+        self.trace = [] if trace else None  # (address, value, rw) every cycle
+        self._read_events = {}
+        self._in_reset = True
+        self._task = None
+        self._reset_task = None
+
+    def load(self, data, addr=0):
+        self.data[addr : addr + len(data)] = bytes(data)
+
+    def load_file(self, path, addr=0):
+        with open(path, "rb") as f:
+            self.load(f.read(), addr)
+
+    def start(self):
+        if self._task is None:
+            self._in_reset = True
+            self._task = cocotb.start_soon(self._run())
+            self._reset_task = cocotb.start_soon(self._watch_reset())
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+            self._reset_task.kill()
+            self._reset_task = None
+
+    async def wait_for_read(self, addr):
+        # wait for the next read from addr (this includes dummy reads)
+        if addr not in self._read_events:
+            self._read_events[addr] = Event()
+        await self._read_events[addr].wait()
+
+    async def _watch_reset(self):
+        edge = FallingEdge(self.dut.rst_n)
+        while True:
+            await edge
+            self._in_reset = True
+
+    async def _run(self):
+        dut = self.dut
+        uo_out = dut.uo_out
+        uio_out = dut.uio_out
+        uio_in = dut.uio_in
+        rst_n = dut.rst_n
+        edge = FallingEdge(dut.clk)
+        data = self.data
+        trace = self.trace
+        addr_hi = 0
+        data_out = 0
+        high = None  # clk_cpu, known once the cpu has been seen in reset
+
+        while True:
+            await edge
+            if high is not None:
+                high = not high
+            addr_pins = uo_out.value
+            bus_pins = uio_out.value
+            if not (addr_pins.is_resolvable and bus_pins.is_resolvable):
+                continue  # nothing sensible on the pins before reset
+            if self._in_reset:
+                reset = rst_n.value
+                if not reset.is_resolvable:
+                    continue
+                if not reset.integer:
+                    high = not bus_pins.integer & 1
+                elif high is not None:
+                    self._in_reset = False
+            if high is None:
+                continue
+
+            if high:
+                addr_hi = addr_pins.integer
+                data_out = bus_pins.integer
+                continue
+
+            addr = (addr_hi << 8) | addr_pins.integer
+            if bus_pins.integer & 1:  # rw = 1, read
+                uio_in.value = data[addr]
+                if trace is not None:
+                    trace.append((addr, data[addr], 1))
+                if self._read_events:
+                    event = self._read_events.pop(addr, None)
+                    if event is not None:
+                        event.set()
+            else:
+                data[addr] = data_out
+                self.writes.append((addr, data_out))
+                if trace is not None:
+                    trace.append((addr, data_out, 0))
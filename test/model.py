@@ -0,0 +1,312 @@
+import cocotb
+from cocotb.triggers import FallingEdge
+
+import backdoor
+from opcodes import MODES, OP, OPCODES
+
+# golden model of the part of the 6502 that src/instruction_decode.v decodes.
+# it follows the rtl rather than the datasheet where the two differ:
+#   - the flag write mask is `CARRY_FLAG | `ZERO_FLAG | `NEGATIVE_FLAG, which ors
+#     the bit *indices* together (= 3'b111), so only bits 0-2 of P are written
+#     and N never reaches the status register
+#   - AND / INC / loads do not drive the alu carry, so C is cleared by them
+#   - ROL / ROR store an 8 bit rotate (the carry is written back before the
+#     alu result is registered), but Z is computed from the old carry
+#   - opcodes whose addressing bits are not zpg / abs / A / zpg,x fall back to
+#     S_IDLE, so they act as a one byte, two cycle no-op
+# the accumulator and zpg,x forms are decoded but not wired through the
+# datapath yet, so they are left out and raise if executed. the opcodes, their
+# addressing modes, lengths and cycle counts come from inc/opcode.vh, through
+# opcodes.py.
+
+# inc/status_register.vh
+CARRY_FLAG = 0
+ZERO_FLAG = 1
+NEGATIVE_FLAG = 6
+PSR_WRITE_MASK = CARRY_FLAG | ZERO_FLAG | NEGATIVE_FLAG
+
+
+def _flags(carry, result):
+    flags = carry << CARRY_FLAG
+    flags |= (result == 0) << ZERO_FLAG
+    flags |= (result >> 7) << NEGATIVE_FLAG
+    return flags & PSR_WRITE_MASK
+
+
+# alu tables, indexed by (carry << 8) | value
+ASL = [(v << 1) & 0xFF for v in range(256)] * 2
+LSR = [v >> 1 for v in range(256)] * 2
+ROL = [((v << 1) & 0xFF) | (v >> 7) for v in range(256)] * 2
+ROR = [((v & 1) << 7) | (v >> 1) for v in range(256)] * 2
+INC = [(v + 1) & 0xFF for v in range(256)] * 2
+
+ASL_FLAGS = [_flags(v >> 7, (v << 1) & 0xFF) for v in range(256)] * 2
+LSR_FLAGS = [_flags(v & 1, v >> 1) for v in range(256)] * 2
+ROL_FLAGS = [_flags(v >> 7, ((v << 1) & 0xFF) | c) for c in (0, 1) for v in range(256)]
+ROR_FLAGS = [_flags(v & 1, (c << 7) | (v >> 1)) for c in (0, 1) for v in range(256)]
+INC_FLAGS = [_flags(0, (v + 1) & 0xFF) for v in range(256)] * 2
+FLG_FLAGS = [_flags(0, v) for v in range(256)] * 2
+
+
+class CPU:
+    def __init__(self, memory=None):
+        self.mem = bytearray(0x10000) if memory is None else bytearray(memory)
+        self.reset()
+
+    def reset(self):
+        self.a = 0
+        self.x = 0
+        self.y = 0
+        self.p = 0
+        self.pc = 0
+        self.cycles = 0
+        self.instructions = 0
+
+    def state(self):
+        return {"a": self.a, "x": self.x, "y": self.y, "p": self.p, "pc": self.pc}
+
+    def run(self, count):
+        # about 2 million instructions/s on a program already in memory,
+        # step() about half that. generating a random program as it runs
+        # (randprog's expected()) brings it down to about 260 thousand/s
+        ops = OPS
+        mem = self.mem
+        for _ in range(count):
+            ops[mem[self.pc]][0](self)
+
+    def step(self):
+        # execute one instruction and return the bus transactions it has to
+        # make, as (address, value, rw) with rw = 1 for a read
+        mem = self.mem
+        pc = self.pc
+        opcode = mem[pc]
+        handler, length, reads, writes = OPS[opcode]
+        bus = [(pc, opcode, 1)]
+        if length == 2:
+            ea = mem[(pc + 1) & 0xFFFF]
+            bus.append(((pc + 1) & 0xFFFF, ea, 1))
+        elif length == 3:
+            lb = mem[(pc + 1) & 0xFFFF]
+            hb = mem[(pc + 2) & 0xFFFF]
+            bus.append(((pc + 1) & 0xFFFF, lb, 1))
+            bus.append(((pc + 2) & 0xFFFF, hb, 1))
+            ea = (hb << 8) | lb
+        if reads:
+            bus.append((ea, mem[ea], 1))
+        handler(self)
+        if writes:
+            bus.append((ea, mem[ea], 0))
+        return bus
+
+
+def _unmodelled(cpu):
+    raise ValueError(f"opcode {cpu.mem[cpu.pc]:02x} at {cpu.pc:04x} is not modelled")
+
+
+def _nop(cycles):
+    def op(cpu):
+        cpu.pc = (cpu.pc + 1) & 0xFFFF
+        cpu.cycles += cycles
+        cpu.instructions += 1
+
+    return op
+
+
+def _rmw_zpg(result, flags, cycles):
+    def op(cpu):
+        mem = cpu.mem
+        ea = mem[(cpu.pc + 1) & 0xFFFF]
+        index = ((cpu.p & 1) << 8) | mem[ea]
+        mem[ea] = result[index]
+        cpu.p = flags[index]
+        cpu.pc = (cpu.pc + 2) & 0xFFFF
+        cpu.cycles += cycles
+        cpu.instructions += 1
+
+    return op
+
+
+def _rmw_abs(result, flags, cycles):
+    def op(cpu):
+        mem = cpu.mem
+        pc = cpu.pc
+        ea = mem[(pc + 1) & 0xFFFF] | (mem[(pc + 2) & 0xFFFF] << 8)
+        index = ((cpu.p & 1) << 8) | mem[ea]
+        mem[ea] = result[index]
+        cpu.p = flags[index]
+        cpu.pc = (pc + 3) & 0xFFFF
+        cpu.cycles += cycles
+        cpu.instructions += 1
+
+    return op
+
+
+def _load_zpg(register, cycles):
+    def op(cpu):
+        mem = cpu.mem
+        value = mem[mem[(cpu.pc + 1) & 0xFFFF]]
+        setattr(cpu, register, value)
+        cpu.p = FLG_FLAGS[value]
+        cpu.pc = (cpu.pc + 2) & 0xFFFF
+        cpu.cycles += cycles
+        cpu.instructions += 1
+
+    return op
+
+
+def _store_zpg(register, cycles):
+    def op(cpu):
+        mem = cpu.mem
+        mem[mem[(cpu.pc + 1) & 0xFFFF]] = getattr(cpu, register)
+        cpu.pc = (cpu.pc + 2) & 0xFFFF
+        cpu.cycles += cycles
+        cpu.instructions += 1
+
+    return op
+
+
+def _and_zpg(cycles):
+    def op(cpu):
+        mem = cpu.mem
+        cpu.a &= mem[mem[(cpu.pc + 1) & 0xFFFF]]
+        cpu.p = FLG_FLAGS[cpu.a]
+        cpu.pc = (cpu.pc + 2) & 0xFFFF
+        cpu.cycles += cycles
+        cpu.instructions += 1
+
+    return op
+
+
+# opcode -> (handler, length in bytes, reads its operand, writes its operand),
+# the lengths and the cycles the handlers count from opcodes.OPCODES. opcodes
+# the decoder doesn't know take the S_IDLE path, the cycles of a NOP
+_NOP = _nop(OPCODES[OP.NOP].cycles)
+OPS = []
+for _opcode in range(256):
+    if (_opcode >> 2) & 0b111 in (
+        MODES["ZPG"],
+        MODES["ZPG_X"],
+        MODES["ABS"],
+        MODES["A"],
+    ):
+        OPS.append((_unmodelled, 1, False, False))
+    else:
+        OPS.append((_NOP, 1, False, False))
+
+RMW = {
+    OP.ASL_ZPG: (ASL, ASL_FLAGS),
+    OP.LSR_ZPG: (LSR, LSR_FLAGS),
+    OP.ROL_ZPG: (ROL, ROL_FLAGS),
+    OP.ROR_ZPG: (ROR, ROR_FLAGS),
+    OP.INC_ZPG: (INC, INC_FLAGS),
+    OP.ASL_ABS: (ASL, ASL_FLAGS),
+    OP.LSR_ABS: (LSR, LSR_FLAGS),
+    OP.ROL_ABS: (ROL, ROL_FLAGS),
+    OP.ROR_ABS: (ROR, ROR_FLAGS),
+    OP.INC_ABS: (INC, INC_FLAGS),
+}
+LOAD_STORE = {
+    OP.LD_A_ZPG: (_load_zpg, "a", True, False),
+    OP.LD_X_ZPG: (_load_zpg, "x", True, False),
+    OP.LD_Y_ZPG: (_load_zpg, "y", True, False),
+    OP.ST_A_ZPG: (_store_zpg, "a", False, True),
+    OP.ST_X_ZPG: (_store_zpg, "x", False, True),
+    OP.ST_Y_ZPG: (_store_zpg, "y", False, True),
+}
+for _opcode, _tables in RMW.items():
+    _entry = OPCODES[_opcode]
+    _make = _rmw_abs if _entry.mode == "ABS" else _rmw_zpg
+    OPS[_opcode] = (_make(*_tables, _entry.cycles), _entry.length, True, True)
+for _opcode, (_make, _register, _reads, _writes) in LOAD_STORE.items():
+    _entry = OPCODES[_opcode]
+    OPS[_opcode] = (_make(_register, _entry.cycles), _entry.length, _reads, _writes)
+_entry = OPCODES[OP.AND_ZPG]
+OPS[OP.AND_ZPG] = (_and_zpg(_entry.cycles), _entry.length, True, False)
+OPS[OP.NOP] = (_NOP, OPCODES[OP.NOP].length, False, False)
+
+NOPS = [op for op in range(256) if OPS[op][0] is _NOP]
+
+# every opcode the decoder gives its own behaviour
+IMPLEMENTED = [OP.NOP] + [
+    op for op in range(256) if OPS[op][0] not in (_NOP, _unmodelled)
+]
+
+
+def rmw(opcode, value, p=0):
+    # value written back and new P for a single read-modify-write instruction
+    result, flags = RMW[opcode]
+    index = ((p & 1) << 8) | value
+    return result[index], flags[index]
+
+
+class Lockstep:
+    # runs the model alongside the rtl one instruction at a time. at every
+    # opcode fetch (S_OPCODE_READ) the architectural registers are compared and
+    # the bus transactions the model expects have to show up, in order, in what
+    # the memory saw since the previous fetch. the memory must be tracing.
+    # it follows the decoder STATE and reads the registers through the
+    # backdoor, so it is RTL only.
+
+    S_OPCODE_READ = 1
+
+    def __init__(self, dut, memory, cpu=None):
+        self.dut = dut
+        self.memory = memory
+        self.cpu = CPU(memory.data) if cpu is None else cpu
+        self.checked = 0
+
+    async def run(self, count):
+        user_project = self.dut.user_project
+        state = user_project.instructionDecode.STATE
+        clk_cpu = user_project.clk_cpu
+        edge = FallingEdge(self.dut.clk)
+        trace = self.memory.trace
+        expected = None
+        start = 0
+        in_fetch = False
+
+        while self.checked < count:
+            await edge
+            if not clk_cpu.value:
+                continue
+            fetching = state.value.integer == self.S_OPCODE_READ
+            if not fetching or in_fetch:
+                in_fetch = fetching
+                continue
+            in_fetch = True
+
+            # the opcode read that got us here belongs to the next instruction
+            end = len(trace) - 1
+            if expected is not None:
+                self._check_bus(expected, trace[start:end])
+            start = end
+
+            rtl = backdoor.read_state(self.dut)
+            model = self.cpu.state()
+            if rtl != model:
+                raise AssertionError(
+                    f"instruction {self.checked}: rtl {rtl} != model {model}"
+                )
+            self.checked += 1
+            if self.checked < count:
+                expected = self.cpu.step()
+
+    def _check_bus(self, expected, seen):
+        writes = [t for t in seen if t[2] == 0]
+        if writes != [t for t in expected if t[2] == 0]:
+            raise AssertionError(
+                f"instruction {self.checked}: wrote {writes}, expected {expected}"
+            )
+        i = 0
+        for transaction in seen:
+            if i < len(expected) and transaction == expected[i]:
+                i += 1
+        if i != len(expected):
+            raise AssertionError(
+                f"instruction {self.checked}: bus {seen} is missing {expected[i:]}"
+            )
+
+
+def start_lockstep(dut, memory, count, cpu=None):
+    lockstep = Lockstep(dut, memory, cpu)
+    return lockstep, cocotb.start_soon(lockstep.run(count))
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+import re
+from collections import namedtuple
+from types import SimpleNamespace
+
+# the opcode table, read from inc/opcode.vh and inc/alu_ops.vh so the tests
+# follow the rtl's definitions, and a small assembler on top of it.
+#
+# the parsed table is cached in .opcode_cache.json under a hash of the two
+# files, and only rebuilt when one of them changes.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCES = [
+    os.path.join(HERE, "..", "inc", "opcode.vh"),
+    os.path.join(HERE, "..", "inc", "alu_ops.vh"),
+]
+CACHE = os.path.join(HERE, ".opcode_cache.json")
+
+# length is in bytes, cycles is clk_cpu cycles from one S_OPCODE_READ to the
+# next (None if the decoder never gets back there), alu is the alu op it
+# ends up using, if any
+Opcode = namedtuple("Opcode", "value name mnemonic mode length cycles alu")
+
+# addressing modes without an ADR_ define
+IMPLIED = "IMP"
+
+LENGTHS = {"ZPG": 2, "ZPG_X": 2, "ABS": 3, "A": 1, IMPLIED: 1}
+
+RMW = {"ASL", "LSR", "ROL", "ROR", "INC"}
+LOADS = {"LDA", "LDX", "LDY"}
+STORES = {"STA", "STX", "STY"}
+
+
+def _cycles(value, mnemonic, mode, defines):
+    # follows the states instruction_decode.v goes through
+    if mode == IMPLIED:
+        return 2  # S_OPCODE_READ, S_IDLE
+    if mode == "ZPG_X":
+        # only the shifts and rotates get out of S_IDL_ADR_WRITE
+        if value & defines["ALU_MASK"] != defines["ALU_SHIFT_ZPG_X"]:
+            return None
+        return 9
+    if mode == "A":
+        return 3  # S_OPCODE_READ, S_ALU_FINAL, S_ALU_TMX
+    if mnemonic in LOADS or mnemonic == "AND":
+        return 5 if mode == "ZPG" else None
+    if mnemonic in STORES:
+        return 7 if mode == "ZPG" else None
+    # read-modify-write: ends in S_DBUF_OUTPUT, S_IDLE
+    return 8 if mode == "ABS" else 7
+
+
+def _alu(mnemonic, alu_ops):
+    if mnemonic in LOADS:
+        return "FLG"
+    if mnemonic in alu_ops and mnemonic != "NOP":
+        return mnemonic
+    return None
+
+
+def _parse(opcode_vh, alu_ops_vh):
+    modes = {
+        name: int(bits, 2)
+        for name, bits in re.findall(r"`define\s+ADR_(\w+)\s+3'b([01]{3})", opcode_vh)
+    }
+    alu_ops = {
+        name: int(bits, 2)
+        for name, bits in re.findall(r"`define\s+(\w+)\s+5'b([01]{5})", alu_ops_vh)
+    }
+    defines = {
+        name: int(bits, 2)
+        for name, bits in re.findall(r"`define\s+OP_(\w+)\s+8'b([01]{8})\b", opcode_vh)
+    }
+
+    # longest first, so ZPG_X is tried before ZPG
+    suffixes = sorted(modes, key=len, reverse=True)
+    table = []
+    for name, value in defines.items():
+        if name.startswith("ALU_"):
+            continue  # masks and opcode groups, not instructions
+        for mode in suffixes:
+            if name.endswith("_" + mode):
+                op = name[: -len(mode) - 1]
+                break
+        else:
+            mode = IMPLIED
+            op = name
+        mnemonic = op.replace("_", "")
+        table.append(
+            Opcode(
+                value,
+                name,
+                mnemonic,
+                mode,
+                LENGTHS[mode],
+                _cycles(value, mnemonic, mode, defines),
+                _alu(mnemonic, alu_ops),
+            )
+        )
+    return table, modes, alu_ops
+
+
+def _load():
+    texts = []
+    for path in SOURCES:
+        with open(path) as f:
+            texts.append(f.read())
+    key = hashlib.sha256("\0".join(texts).encode()).hexdigest()
+
+    try:
+        with open(CACHE) as f:
+            cached = json.load(f)
+        if cached["key"] == key:
+            return (
+                [Opcode(*row) for row in cached["opcodes"]],
+                cached["modes"],
+                cached["alu_ops"],
+            )
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    table, modes, alu_ops = _parse(*texts)
+    try:
+        with open(CACHE, "w") as f:
+            json.dump(
+                {"key": key, "opcodes": table, "modes": modes, "alu_ops": alu_ops}, f
+            )
+    except OSError:
+        pass
+    return table, modes, alu_ops
+
+
+TABLE, MODES, ALU_OPS = _load()
+
+# value -> Opcode. a value defined twice (OP_AND_ABS is OP_ROL_ABS) keeps
+# the first definition, which is the one the decoder checks first
+OPCODES = {}
+for _opcode in TABLE:
+    OPCODES.setdefault(_opcode.value, _opcode)
+
+# OP.ASL_ZPG etc., every define including the duplicates
+OP = SimpleNamespace(**{opcode.name: opcode.value for opcode in TABLE})
+
+# (mnemonic, mode) -> value, for the assembler. a define whose value the
+# decoder runs as another instruction is left out, and kept apart so the
+# assembler can say why (AND $1234 would assemble to ROL_ABS)
+_BY_MODE = {}
+_SHADOWED = {}
+for _opcode in TABLE:
+    _key = (_opcode.mnemonic, _opcode.mode)
+    if OPCODES[_opcode.value] is _opcode:
+        _BY_MODE.setdefault(_key, _opcode.value)
+    else:
+        _SHADOWED.setdefault(_key, _opcode)
+
+
+def _lookup(mnemonic, mode, line):
+    # the value of mnemonic in mode, or None if there is no such define
+    value = _BY_MODE.get((mnemonic, mode))
+    shadowed = _SHADOWED.get((mnemonic, mode))
+    if value is None and shadowed is not None:
+        decoded = OPCODES[shadowed.value].name
+        raise ValueError(
+            f"line {line}: {shadowed.name} is {shadowed.value:02x}, "
+            f"which the decoder runs as {decoded}"
+        )
+    return value
+
+
+def _number(text, line):
+    try:
+        if text.startswith("$"):
+            return int(text[1:], 16)
+        return int(text, 0)
+    except ValueError:
+        raise ValueError(f"line {line}: bad number {text!r}") from None
+
+
+def assemble(source):
+    # one instruction per line, in the usual 6502 syntax:
+    #   NOP            implied
+    #   ASL / ASL A    accumulator
+    #   LDA $80        zero page (a value up to $ff)
+    #   ASL $80,X      zero page,x
+    #   ROL $1234      absolute (four hex digits, or a value over $ff)
+    #   .byte 1, $02   raw bytes
+    # numbers are $hex or anything int() takes, and ; starts a comment
+    out = bytearray()
+    for line, text in enumerate(source.splitlines(), 1):
+        text = text.split(";", 1)[0].strip()
+        if not text:
+            continue
+        mnemonic, _, operand = text.partition(" ")
+        mnemonic = mnemonic.upper()
+        operand = operand.replace(" ", "")
+
+        if mnemonic == ".BYTE":
+            for value in operand.split(","):
+                value = _number(value, line)
+                if not 0 <= value <= 0xFF:
+                    raise ValueError(f"line {line}: {value} is not a byte")
+                out.append(value)
+            continue
+
+        if not operand:
+            modes = [IMPLIED, "A"]
+        elif operand.upper() == "A":
+            modes = ["A"]
+        elif operand.upper().endswith(",X"):
+            modes = ["ZPG_X"]
+            operand = operand[:-2]
+        elif operand.startswith("$") and len(operand) == 5:
+            modes = ["ABS"]
+        else:
+            modes = ["ZPG", "ABS"]
+
+        for mode in modes:
+            value = _lookup(mnemonic, mode, line)
+            if value is not None:
+                break
+        else:
+            raise ValueError(f"line {line}: no {mnemonic} {' or '.join(modes)}")
+
+        length = LENGTHS[mode]
+        if length == 1:
+            out.append(value)
+            continue
+        address = _number(operand, line)
+        if mode == "ZPG" and address > 0xFF:
+            value = _lookup(mnemonic, "ABS", line)
+            if value is None:
+                raise ValueError(f"line {line}: no absolute {mnemonic}")
+            length = 3
+        if not 0 <= address < (1 << (8 * (length - 1))):
+            raise ValueError(f"line {line}: address {operand} out of range")
+        out.append(value)
+        out += address.to_bytes(length - 1, "little")
+    return bytes(out)
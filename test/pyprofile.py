@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""Where the wall time of the tests goes: the simulator, or Python.
+
+    make PY_PROFILE=1                       # writes results.profile.json
+    python pyprofile.py results.profile.json
+
+With PY_PROFILE set, every test records:
+    wall_s, python_s, sim_s   wall time, the part of it spent in Python (in
+                              the scheduler, from a trigger firing until
+                              control goes back to the simulator) and the rest
+    sim_time_ns               simulated time
+    coroutines                seconds and resumes per coroutine function
+    gpi                       value reads, deferred and immediate writes,
+                              trigger objects created and callbacks registered
+                              (primed) per trigger type
+    fired                     triggers fired per type
+The file goes next to results.xml (COCOTB_RESULTS_FILE), named after it. The
+counting itself costs time, so compare profiled runs with each other rather
+than with normal ones. cocotb's own COCOTB_ENABLE_PROFILING gives a cProfile
+of the same runs, function by function.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+import cocotb
+from cocotb import handle, triggers
+from cocotb.triggers import Event
+from cocotb.utils import get_sim_time
+
+# handle classes with their own value property or _set_value
+_VALUE_CLASSES = [
+    handle.ModifiableObject,
+    handle.RealObject,
+    handle.EnumObject,
+    handle.IntegerObject,
+    handle.StringObject,
+    handle.ConstantObject,
+]
+_WRITE_CLASSES = _VALUE_CLASSES[:-1] + [handle.NonHierarchyIndexableObject]
+# GPI triggers with their own prime
+_PRIME_CLASSES = [
+    triggers.Timer,
+    triggers.ReadOnly,
+    triggers.ReadWrite,
+    triggers.NextTimeStep,
+    triggers._EdgeBase,
+]
+
+
+def results_path():
+    results = os.environ.get("COCOTB_RESULTS_FILE", "results.xml")
+    return os.path.splitext(results)[0] + ".profile.json"
+
+
+class Profiler:
+    def __init__(self):
+        self.installed = False
+        self.saved = False
+        self._task = None
+        self._reset()
+
+    def _reset(self):
+        self.python = 0.0
+        self.coroutines = {}
+        self.reads = 0
+        self.writes = 0
+        self.immediate_writes = 0
+        self.created = Counter()
+        self.primed = Counter()
+        self.fired = Counter()
+
+    def start(self, test, path=None):
+        self.install()
+        if self._task is None:
+            self._reset()
+            self._task = cocotb.start_soon(self._run(test, path or results_path()))
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    async def _run(self, test, path):
+        wall = time.perf_counter()
+        sim = get_sim_time("ns")
+        try:
+            await Event().wait()
+        finally:
+            # the test gets killed at its end, which closes this coroutine
+            self._task = None
+            wall = time.perf_counter() - wall
+            self.save(path, test, wall, get_sim_time("ns") - sim)
+
+    def result(self, wall, sim_time_ns):
+        coroutines = sorted(self.coroutines.items(), key=lambda c: -c[1][0])
+        return {
+            "wall_s": wall,
+            "python_s": self.python,
+            "sim_s": max(wall - self.python, 0.0),
+            "sim_time_ns": sim_time_ns,
+            "coroutines": {
+                name: {"seconds": seconds, "resumes": resumes}
+                for name, (seconds, resumes) in coroutines
+            },
+            "gpi": {
+                "reads": self.reads,
+                "writes": self.writes,
+                "immediate_writes": self.immediate_writes,
+                "triggers_created": dict(self.created),
+                "triggers_primed": dict(self.primed),
+            },
+            "fired": dict(self.fired),
+        }
+
+    def save(self, path, test, wall, sim_time_ns):
+        # the first test of a run starts the file afresh, the others add to it
+        data = {"tests": {}}
+        if self.saved:
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                pass
+        data["tests"][test] = self.result(wall, sim_time_ns)
+        tests = data["tests"].values()
+        data["total"] = {
+            key: sum(t[key] for t in tests)
+            for key in ("wall_s", "python_s", "sim_s", "sim_time_ns")
+        }
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
+        self.saved = True
+
+    def install(self):
+        # wraps the scheduler, handle and trigger methods that matter, once
+        if self.installed:
+            return
+        self.installed = True
+        profiler = self
+        perf_counter = time.perf_counter
+        scheduler = cocotb.scheduler
+
+        react = scheduler._react
+
+        def _react(trigger):
+            # triggers get primed with scheduler._react looked up at that
+            # time, so everything primed from here on comes through this
+            if scheduler._is_reacting:
+                return react(trigger)
+            profiler.fired[type(trigger).__name__] += 1
+            start = perf_counter()
+            try:
+                return react(trigger)
+            finally:
+                profiler.python += perf_counter() - start
+
+        scheduler._react = _react
+
+        schedule = scheduler._schedule
+
+        def _schedule(coroutine, trigger=None):
+            start = perf_counter()
+            try:
+                return schedule(coroutine, trigger)
+            finally:
+                coro = getattr(coroutine, "_coro", coroutine)
+                name = getattr(coro, "__qualname__", type(coro).__name__)
+                entry = profiler.coroutines.setdefault(name, [0.0, 0])
+                entry[0] += perf_counter() - start
+                entry[1] += 1
+
+        scheduler._schedule = _schedule
+
+        for cls in _VALUE_CLASSES:
+            prop = cls.__dict__.get("value")
+            if prop is None:
+                continue
+
+            def getter(self, _get=prop.fget):
+                profiler.reads += 1
+                return _get(self)
+
+            cls.value = property(getter, prop.fset, prop.fdel, prop.__doc__)
+
+        schedule_write = scheduler._schedule_write
+        for cls in _WRITE_CLASSES:
+            set_value = cls.__dict__.get("_set_value")
+            if set_value is None:
+                continue
+
+            def _set_value(self, value, call_sim, _set=set_value):
+                if call_sim == schedule_write:
+                    profiler.writes += 1
+                else:
+                    profiler.immediate_writes += 1
+                return _set(self, value, call_sim)
+
+            cls._set_value = _set_value
+
+        init = triggers.GPITrigger.__init__
+
+        def __init__(self, *args, **kwargs):
+            profiler.created[type(self).__name__] += 1
+            init(self, *args, **kwargs)
+
+        triggers.GPITrigger.__init__ = __init__
+
+        for cls in _PRIME_CLASSES:
+            prime = cls.__dict__["prime"]
+
+            def counting_prime(self, callback, _prime=prime):
+                profiler.primed[type(self).__name__] += 1
+                return _prime(self, callback)
+
+            cls.prime = counting_prime
+
+
+# PY_PROFILE=1 in the Makefile (see helper.INSTRUMENTS), as in the docstring
+_profiler = Profiler()
+
+
+def start_instrument(dut, setting, test):
+    _profiler.start(test)
+
+
+def report(data, top=10):
+    total = data["total"]
+    share = total["python_s"] / total["wall_s"] if total["wall_s"] else 0
+    print(
+        f"{total['wall_s']:.1f}s wall, {total['python_s']:.1f}s in Python "
+        f"({share:.0%}), {total['sim_s']:.1f}s in the simulator"
+    )
+    print(f"\n{'test':<28} {'wall s':>8} {'python':>7} {'reads':>9} {'writes':>8}")
+    for name, test in data["tests"].items():
+        gpi = test["gpi"]
+        share = test["python_s"] / test["wall_s"] if test["wall_s"] else 0
+        writes = gpi["writes"] + gpi["immediate_writes"]
+        print(
+            f"{name:<28} {test['wall_s']:>8.2f} {share:>7.0%} "
+            f"{gpi['reads']:>9} {writes:>8}"
+        )
+
+    coroutines = {}
+    primed = Counter()
+    for test in data["tests"].values():
+        for name, c in test["coroutines"].items():
+            entry = coroutines.setdefault(name, [0.0, 0])
+            entry[0] += c["seconds"]
+            entry[1] += c["resumes"]
+        primed.update(test["gpi"]["triggers_primed"])
+    print(f"\n{'coroutine':<48} {'seconds':>8} {'resumes':>10}")
+    for name, (seconds, resumes) in sorted(coroutines.items(), key=lambda c: -c[1][0])[
+        :top
+    ]:
+        print(f"{name:<48} {seconds:>8.2f} {resumes:>10}")
+    print(
+        "\ntriggers primed: " + ", ".join(f"{k} {v}" for k, v in primed.most_common())
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("profile", nargs="?", default="results.profile.json")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    try:
+        with open(args.profile) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        print(f"no profile in {args.profile}, run with PY_PROFILE=1")
+        return 1
+    report(data, args.top)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
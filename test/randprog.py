@@ -0,0 +1,154 @@
+import random
+
+import model
+
+# seeded constrained random programs for the cpu, long enough to run
+# thousands of instructions without building them all up front.
+#
+# the cpu comes out of reset fetching from $0000, and the only way through
+# memory is straight on (nothing branches yet), so a program is laid out as:
+#   $0000 - zpg hi    zero page data. the cpu runs over it first, so it starts
+#                     out as one byte no-ops
+#   zpg hi + 1 -      the instructions, one after the other, then no-ops ($00)
+#                     up to the absolute data
+#   absolute lo - hi  absolute data, random
+# zero page operands are taken from the zpg range and absolute ones from the
+# absolute range, so nothing ever writes over code that has yet to run.
+#
+# the cpu puts the high byte of an address out in the clk_cpu high phase
+# before the low byte, and pc only steps on to a new page after that, so
+# the first byte fetched from a page comes from the page before it ($0200
+# reads $0100). the model knows nothing of this, so every page start the
+# code runs over holds a one byte no-op, as does $0000 before the first one
+# (the zpg range starts past it): the cpu then runs a no-op either way.
+# pin_address gives the address such a fetch shows up as.
+#
+# the data and the instructions come from two random.Random streams seeded
+# from the one seed, so the program is the same every time it is generated
+# and can be generated twice instead of kept: once to work out the expected
+# state and once to feed the simulation.
+
+
+class RandomProgram:
+    def __init__(
+        self,
+        seed=None,
+        count=4096,
+        opcodes=None,
+        zpg=(0x01, 0x3F),
+        absolute=(0xC000, 0xFFFF),
+    ):
+        # opcodes is a list, or a dict of opcode -> weight, of opcodes the
+        # model can run (model.IMPLEMENTED by default). count is how many
+        # instructions to generate after the zero page, fewer if they don't
+        # fit below the absolute data
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seed = seed
+        self.count = count
+        self.zpg = zpg
+        self.absolute = absolute
+        self.start = zpg[1] + 1
+
+        if opcodes is None:
+            opcodes = model.IMPLEMENTED
+        if not isinstance(opcodes, dict):
+            opcodes = dict.fromkeys(opcodes, 1)
+        for opcode in opcodes:
+            if opcode not in model.IMPLEMENTED and opcode not in model.NOPS:
+                raise ValueError(f"opcode {opcode:02x} is not modelled")
+        self.opcodes = list(opcodes)
+        self._cum_weights = []
+        total = 0
+        for weight in opcodes.values():
+            total += weight
+            self._cum_weights.append(total)
+
+        if not 0 <= zpg[0] <= zpg[1] <= 0xFF:
+            raise ValueError(f"zero page range {zpg} is not in the zero page")
+        if not zpg[0]:
+            raise ValueError(f"zero page range {zpg} includes $0000")
+        if not self.start < absolute[0] <= absolute[1] <= 0xFFFF:
+            raise ValueError(
+                f"absolute range {absolute} overlaps the zero page or code"
+            )
+
+    def memory(self):
+        # the 64 KiB the program starts with, without the instructions
+        rng = random.Random(f"{self.seed}:data")
+        data = bytearray(0x10000)
+        data[0 : self.start] = bytes(rng.choices(model.NOPS, k=self.start))
+        lo, hi = self.absolute
+        data[lo : hi + 1] = rng.randbytes(hi + 1 - lo)
+        return data
+
+    def instructions(self):
+        # yields (address, bytes) for every instruction in order
+        rng = random.Random(f"{self.seed}:code")
+        choices = rng.choices
+        randint = rng.randint
+        opcodes = self.opcodes
+        cum_weights = self._cum_weights
+        ops = model.OPS
+        zpg_lo, zpg_hi = self.zpg
+        abs_lo, abs_hi = self.absolute
+
+        # leave at least two no-ops between the code and the absolute data,
+        # the cpu is stopped when it reads the second one
+        end = abs_lo - 2
+        nop = bytes((model.OP.NOP,))
+        addr = self.start
+        for _ in range(self.count):
+            opcode = choices(opcodes, cum_weights=cum_weights)[0]
+            length = ops[opcode][1]
+            if (addr - 1) >> 8 != (addr + length - 1) >> 8:
+                # it would cover a page start, pad up to and over it instead
+                page = (addr + length - 1) & 0xFF00
+                if page + 1 + length > end:
+                    return
+                for pad in range(addr, page + 1):
+                    yield pad, nop
+                addr = page + 1
+            if addr + length > end:
+                return
+            if length == 1:
+                code = bytes((opcode,))
+            elif length == 2:
+                code = bytes((opcode, randint(zpg_lo, zpg_hi)))
+            else:
+                target = randint(abs_lo, abs_hi)
+                code = bytes((opcode, target & 0xFF, target >> 8))
+            yield addr, code
+            addr += length
+
+    def expected(self):
+        # run the program on the model, returning the model once it gets to
+        # the first no-op after the program. its pc is where the program
+        # ends, and cpu.instructions includes the zero page no-ops
+        cpu = model.CPU(self.memory())
+        cpu.run(self.start)
+        for addr, code in self.instructions():
+            cpu.mem[addr : addr + len(code)] = code
+            cpu.run(1)
+        return cpu
+
+
+def pin_address(addr):
+    # the address a fetch from addr shows up as on the pins (see above)
+    if addr > 0xFF and not addr & 0xFF:
+        return addr - 0x100
+    return addr
+
+
+async def stream(memory, program, window=0x100):
+    # load the instructions into a memory.Memory as the cpu gets to them,
+    # keeping between one and two windows of code loaded ahead of it. every
+    # byte of code gets read, so the cpu's progress is followed by waiting
+    # for reads of the code
+    data = memory.data
+    limit = program.start + 2 * window
+    for addr, code in program.instructions():
+        if addr >= limit:
+            await memory.wait_for_read(pin_address(addr - window))
+            limit = addr + window
+        data[addr : addr + len(code)] = code
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Rerun one failing vector of a test, dumping just that vector.
+
+    python replay.py                         # the last recorded failure
+    python replay.py --list                  # every recorded failure
+    python replay.py --failure 2             # the third one listed
+    python replay.py --test test_ASL_ZPG_Base --seed 1712345678 --vector 17
+    python replay.py GATES=yes               # extra arguments go to make
+
+Every vector that fails in a normal run is appended to failures.jsonl with
+the test, its RANDOM_SEED, the vector's index and the first vector the cpu
+ran since its last reset (see helper.vector). A replay runs the test with the
+same seed but only simulates the vectors from that first one up to the
+failing one, and dumps only the failing one to sim_build/replay_<test>_<n>.
+random is seeded per test (helper.start_clock), so the test draws the same
+vectors on its own as it did after the other tests. A failure from
+test_multi.py (MULTI=<n>) is replayed there, on the same number of cpus, so
+the cpu that failed runs the same vectors before the failing one again.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import xml.etree.ElementTree as ET
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_failures(path):
+    failures = []
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    failures.append(json.loads(line))
+    except OSError:
+        pass
+    return failures
+
+
+def replay(failure, make_args, dump=True):
+    name = f"sim_build/replay_{failure['test']}_{failure['vector']}"
+    results = f"{name}.xml"
+    cmd = [
+        "make",
+        f"TESTCASE={failure['test']}",
+        f"RANDOM_SEED={failure['seed']}",
+        f"REPLAY_VECTOR={failure['vector']}",
+        f"REPLAY_FROM={failure.get('from', failure['vector'])}",
+        f"COCOTB_RESULTS_FILE={results}",
+        *make_args,
+    ]
+    if failure.get("multi"):
+        cmd.append(f"MULTI={failure['multi']}")
+    if dump:
+        cmd += ["DUMP=1", f"DUMP_NAME={name}"]
+    subprocess.run(cmd, cwd=HERE)
+
+    try:
+        root = ET.parse(os.path.join(HERE, results)).getroot()
+    except (OSError, ET.ParseError):
+        return None, name
+    cases = list(root.iter("testcase"))
+    failed = not cases or any(
+        case.find("failure") is not None or case.find("error") is not None
+        for case in cases
+    )
+    return failed, name
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--failures", default=os.path.join(HERE, "failures.jsonl"))
+    parser.add_argument("--list", action="store_true")
+    parser.add_argument(
+        "--failure", type=int, default=-1, help="which recorded failure, by index"
+    )
+    parser.add_argument("--test")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--vector", type=int)
+    parser.add_argument("--from", dest="first", type=int)
+    parser.add_argument("--multi", type=int, help="MULTI of a test_multi.py run")
+    parser.add_argument("--no-dump", action="store_true")
+    parser.add_argument("make_args", nargs="*", help="e.g. GATES=yes DUMP_FORMAT=fst")
+    args = parser.parse_args()
+
+    failures = load_failures(args.failures)
+    if args.list:
+        for i, f in enumerate(failures):
+            multi = f" MULTI={f['multi']}" if f.get("multi") else ""
+            print(
+                f"{i:>4} {f['test']} vector {f['vector']} (from {f['from']}) "
+                f"seed {f['seed']}{multi}"
+            )
+        return 0
+
+    if args.test is not None:
+        if args.seed is None or args.vector is None:
+            parser.error("--test needs --seed and --vector")
+        failure = {"test": args.test, "seed": args.seed, "vector": args.vector}
+        failure["from"] = args.vector if args.first is None else args.first
+        if args.multi:
+            failure["multi"] = args.multi
+    else:
+        if not failures:
+            print(f"no failures recorded in {args.failures}")
+            return 1
+        try:
+            failure = failures[args.failure]
+        except IndexError:
+            print(f"only {len(failures)} failures recorded")
+            return 1
+
+    print(
+        f"replaying {failure['test']} vector {failure['vector']} "
+        f"(from {failure['from']}) with seed {failure['seed']}"
+    )
+    failed, name = replay(failure, args.make_args, not args.no_dump)
+    if failed is None:
+        print("the simulation wrote no results")
+        return 1
+    print("still fails" if failed else "passes now")
+    if not args.no_dump:
+        fmt = "fst" if "DUMP_FORMAT=fst" in args.make_args else "vcd"
+        print(f"dump in {name}.{fmt}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
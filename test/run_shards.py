@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""Run the cocotb tests split over several simulator processes.
+
+Each shard gets its own SIM_BUILD and TESTCASE list, and the per shard
+results are merged into results.xml, the file CI checks for failures.
+
+    python run_shards.py -j 8                # RTL
+    python run_shards.py -j 8 GATES=yes      # extra arguments go to make
+    python run_shards.py -j 8 SIM=verilator
+    python run_shards.py -j 8 DUMP=1         # each shard dumps to its sim_build
+    python run_shards.py -j 8 FUNC_COVERAGE=coverage.json
+
+Tests are handed out longest first (using the times from the last run) to
+whichever shard has the least work so far. With FUNC_COVERAGE every shard
+collects coverage in its sim_build and they are all merged into the file
+given.
+"""
+
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+import funccov
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def find_tests(module):
+    with open(os.path.join(HERE, module + ".py")) as f:
+        tree = ast.parse(f.read())
+
+    tests = []
+    for node in tree.body:
+        if not isinstance(node, ast.AsyncFunctionDef):
+            continue
+        for decorator in node.decorator_list:
+            if isinstance(decorator, ast.Call):
+                decorator = decorator.func
+            if ast.unparse(decorator) == "cocotb.test":
+                tests.append(node.name)
+    return tests
+
+
+def load_durations(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def plan_shards(tests, durations, jobs):
+    known = [durations[t] for t in tests if t in durations]
+    default = sum(known) / len(known) if known else 1.0
+    cost = {t: durations.get(t, default) for t in tests}
+
+    shards = [[] for _ in range(min(jobs, len(tests)))]
+    load = [0.0] * len(shards)
+    for test in sorted(tests, key=cost.get, reverse=True):
+        i = load.index(min(load))
+        shards[i].append(test)
+        load[i] += cost[test]
+    return shards, load
+
+
+def run_shards(shards, make_args, kind, coverage=False):
+    procs = []
+    for i, tests in enumerate(shards):
+        sim_build = f"sim_build/{kind}_shard{i}"
+        os.makedirs(os.path.join(HERE, sim_build), exist_ok=True)
+        results = f"{sim_build}/results.xml"
+        log = open(os.path.join(HERE, sim_build, "make.log"), "w")
+        cmd = [
+            "make",
+            f"SIM_BUILD={sim_build}",
+            f"COCOTB_RESULTS_FILE={results}",
+            f"TESTCASE={','.join(tests)}",
+            f"DUMP_NAME={sim_build}/tb",
+            *make_args,
+        ]
+        if coverage:
+            cmd.append(f"FUNC_COVERAGE={sim_build}/coverage.json")
+        procs.append(
+            (
+                tests,
+                results,
+                log,
+                subprocess.Popen(cmd, cwd=HERE, stdout=log, stderr=subprocess.STDOUT),
+            )
+        )
+
+    finished = []
+    for tests, results, log, proc in procs:
+        proc.wait()
+        log.close()
+        finished.append((tests, os.path.join(HERE, results)))
+    return finished
+
+
+def merge_results(finished, output):
+    merged = ET.Element("testsuites", name="results")
+    suite = ET.SubElement(merged, "testsuite", name="all", package="all")
+
+    for i, (tests, path) in enumerate(finished):
+        try:
+            shard_root = ET.parse(path).getroot()
+        except (OSError, ET.ParseError):
+            # the simulator died before cocotb could write anything, make sure
+            # every test it was given shows up as a failure
+            for test in tests:
+                case = ET.SubElement(suite, "testcase", name=test, classname="shard")
+                ET.SubElement(case, "failure", message=f"shard {i} wrote no results")
+            continue
+
+        for shard_suite in shard_root.iter("testsuite"):
+            for child in shard_suite:
+                if child.tag == "property":
+                    child.set("name", f"{child.get('name')}_shard{i}")
+                suite.append(child)
+
+    ET.ElementTree(merged).write(output, encoding="UTF-8", xml_declaration=True)
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--module", default="test")
+    parser.add_argument(
+        "--durations", default=os.path.join(HERE, ".test_durations.json")
+    )
+    parser.add_argument("--results", default=os.path.join(HERE, "results.xml"))
+    parser.add_argument("make_args", nargs="*", help="e.g. GATES=yes SIM=verilator")
+    args = parser.parse_args()
+
+    tests = find_tests(args.module)
+    durations = load_durations(args.durations)
+    shards, load = plan_shards(tests, durations, args.jobs)
+    for i, (shard, seconds) in enumerate(zip(shards, load)):
+        print(f"shard {i}: {len(shard)} tests, ~{seconds:.1f}s")
+
+    start = time.monotonic()
+    coverage = None
+    make_args = [f"MODULE={args.module}"]
+    for arg in args.make_args:
+        if arg.startswith("FUNC_COVERAGE="):
+            coverage = arg.split("=", 1)[1]
+        else:
+            make_args.append(arg)
+    kind = "gl" if "GATES=yes" in args.make_args else "rtl"
+    for arg in args.make_args:
+        if arg.startswith("SIM=") and arg != "SIM=icarus":
+            kind += "_" + arg[4:]
+    finished = run_shards(shards, make_args, kind, coverage is not None)
+    merged = merge_results(finished, args.results)
+    if coverage is not None:
+        cov = funccov.load(coverage) or funccov.Coverage()
+        for i in range(len(shards)):
+            shard = os.path.join(HERE, f"sim_build/{kind}_shard{i}/coverage.json")
+            cov.merge(funccov.load(shard))
+            if os.path.exists(shard):
+                os.remove(shard)
+        cov.save(coverage)
+    elapsed = time.monotonic() - start
+
+    failed = []
+    for case in merged.iter("testcase"):
+        if case.find("failure") is not None or case.find("error") is not None:
+            failed.append(case.get("name"))
+        elif case.get("time") is not None:
+            durations[case.get("name")] = float(case.get("time"))
+    with open(args.durations, "w") as f:
+        json.dump(durations, f, indent=2, sort_keys=True)
+
+    total = len(list(merged.iter("testcase")))
+    print(
+        f"{total} tests in {elapsed:.1f}s over {len(shards)} shards, {len(failed)} failed"
+    )
+    for name in failed:
+        print(f"  FAIL {name}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Compare how fast the simulators get through the same tests.
+
+    python sim_speed.py                       # icarus and verilator, RTL
+    python sim_speed.py --sims icarus GATES=yes
+    python sim_speed.py --sims icarus --clocks cocotb hdl --tests all
+
+Every simulator runs the same TESTCASE list through make, and the clk cycles
+each test simulated (sim_time_ns over the 1 us clk period) are divided by its
+wall time from results.xml. Compile time is not counted. --clocks runs each
+simulator with clk from a cocotb Clock, from tb.v (HDL_CLOCK=1), or both,
+and then also prints how much faster the tb.v clock was. --tests all is every
+test in test.py.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import xml.etree.ElementTree as ET
+
+from run_shards import find_tests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CLK_PERIOD_NS = 1000
+
+DEFAULT_TESTS = [
+    "test_ASL_ZPG_Base",
+    "test_ROL_ABS_Loop",
+    "test_Program_Memory",
+    "test_Random_Lockstep",
+]
+
+
+CLOCKS = {"cocotb": [], "hdl": ["HDL_CLOCK=1"]}
+
+
+def run(sim, clock, tests, make_args):
+    results = f"sim_build/speed_{sim}_{clock}.xml"
+    cmd = [
+        "make",
+        f"SIM={sim}",
+        f"COCOTB_RESULTS_FILE={results}",
+        f"TESTCASE={','.join(tests)}",
+        *CLOCKS[clock],
+        *make_args,
+    ]
+    subprocess.run(cmd, cwd=HERE, stdout=subprocess.DEVNULL, check=True)
+
+    speeds = {}
+    for case in ET.parse(os.path.join(HERE, results)).getroot().iter("testcase"):
+        cycles = float(case.get("sim_time_ns", 0)) / CLK_PERIOD_NS
+        seconds = float(case.get("time", 0))
+        speeds[case.get("name")] = (cycles, seconds)
+    return speeds
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sims", nargs="+", default=["icarus", "verilator"])
+    parser.add_argument("--clocks", nargs="+", choices=CLOCKS, default=["cocotb"])
+    parser.add_argument("--tests", nargs="+", default=DEFAULT_TESTS)
+    parser.add_argument("make_args", nargs="*", help="e.g. GATES=yes")
+    args = parser.parse_args()
+    if args.tests == ["all"]:
+        args.tests = find_tests("test")
+
+    runs = [(sim, clock) for sim in args.sims for clock in args.clocks]
+    speeds = {key: run(*key, args.tests, args.make_args) for key in runs}
+    if len(args.clocks) > 1:
+        names = [f"{sim}/{clock}" for sim, clock in runs]
+    else:
+        names = [sim for sim, _ in runs]
+
+    width = max([24] + [len(t) + 2 for t in args.tests])
+    print(f"{'test':<{width}}" + "".join(f"{name + ' cyc/s':>22}" for name in names))
+    totals = {key: [0.0, 0.0] for key in runs}
+    for test in args.tests:
+        row = f"{test:<{width}}"
+        for key in runs:
+            cycles, seconds = speeds[key].get(test, (0.0, 0.0))
+            totals[key][0] += cycles
+            totals[key][1] += seconds
+            row += f"{cycles / seconds if seconds else 0:>22,.0f}"
+        print(row)
+    row = f"{'total':<{width}}"
+    for key in runs:
+        cycles, seconds = totals[key]
+        row += f"{cycles / seconds if seconds else 0:>22,.0f}"
+    print(row)
+
+    if "cocotb" in args.clocks and "hdl" in args.clocks:
+        for sim in args.sims:
+            before = totals[(sim, "cocotb")][1]
+            after = totals[(sim, "hdl")][1]
+            if after:
+                print(
+                    f"{sim}: {before:.1f}s with a cocotb clock, {after:.1f}s with "
+                    f"the tb.v clock, {before / after:.2f}x"
+                )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
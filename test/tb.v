@@ -6,10 +6,57 @@
 */
 module tb ();
 
-  // Dump the signals to a VCD file. You can view it with gtkwave or surfer.
+  // Dumping is off unless the run asks for it (see DUMP in the Makefile):
+  //   +dump_file=<name>    file to write, tb.vcd or tb.fst for icarus -fst
+  //   +dump_pins           just the signals in this module
+  //   +dump_decode         instructionDecode
+  //   +dump_alu            the ALU
+  //   +dump_all            everything, also the default if no scope is given
+  //   +dump_start=<n>      only dump from clk cycle n ...
+  //   +dump_stop=<n>       ... up to clk cycle n
+  //   +dump_window         only while dump_window is high, which the tests
+  //                        set around the vector a replay is after
+  // You can view the dump with gtkwave or surfer.
+  reg [1023:0] dump_file;
+  integer dump_start;
+  integer dump_stop;
+  reg dump_window = 1'b0;
   initial begin
-    $dumpfile("tb.vcd");
-    $dumpvars(0, tb);
+    if ($value$plusargs("dump_file=%s", dump_file)) begin
+      $dumpfile(dump_file);
+      if ($test$plusargs("dump_all") || !($test$plusargs("dump_pins") ||
+          $test$plusargs("dump_decode") || $test$plusargs("dump_alu"))) begin
+        $dumpvars(0, tb);
+      end else begin
+        if ($test$plusargs("dump_pins")) $dumpvars(1, tb);
+`ifndef GL_TEST
+        // the netlist is flattened, so these only exist in the rtl
+        if ($test$plusargs("dump_decode")) $dumpvars(0, tb.user_project.instructionDecode);
+        if ($test$plusargs("dump_alu")) $dumpvars(0, tb.user_project.ALU);
+`endif
+      end
+
+      if ($test$plusargs("dump_window")) begin
+        $dumpoff;
+        forever begin
+          @(posedge dump_window) $dumpon;
+          @(negedge dump_window) $dumpoff;
+          $dumpflush;
+        end
+      end
+
+      if (!$value$plusargs("dump_start=%d", dump_start)) dump_start = 0;
+      if (dump_start > 0) begin
+        $dumpoff;
+        repeat (dump_start) @(posedge clk);
+        $dumpon;
+      end
+      if ($value$plusargs("dump_stop=%d", dump_stop)) begin
+        repeat (dump_stop - dump_start) @(posedge clk);
+        $dumpoff;
+        $dumpflush;
+      end
+    end
     #1;
   end
 
@@ -23,6 +70,17 @@ module tb ();
   wire [7:0] uio_out;
   wire [7:0] uio_oe;
 
+  // clk comes from cocotb unless +clk_period_ns=<n> is given, in which case
+  // it is generated here (starting high, like cocotb's Clock) and cocotb only
+  // has to wait on the edges it needs. See HDL_CLOCK in the Makefile.
+  integer clk_period_ns;
+  initial begin
+    if ($value$plusargs("clk_period_ns=%d", clk_period_ns)) begin
+      clk = 1'b1;
+      forever #(clk_period_ns / 2.0) clk = ~clk;
+    end
+  end
+
   // Replace tt_um_example with your module name:
   tt_um_6502 user_project (
       .ui_in  (ui_in),    // Dedicated inputs
@@ -0,0 +1,69 @@
+`default_nettype none
+`timescale 1ns / 1ps
+
+/* N independent copies of the design on one clk, for test_multi.py. Each
+   copy sits in cpu[i] with its own set of the pins tb.v has, reset and enable
+   included, so every cpu can be driven, reset and checked on its own while
+   the simulator only steps through time once for all of them.
+*/
+module tb_multi #(
+    parameter N = 4
+) ();
+
+  // Dumping, as in tb.v but always of everything:
+  //   +dump_file=<name>    file to write
+  //   +dump_window         only while dump_window is high
+  reg [1023:0] dump_file;
+  reg dump_window = 1'b0;
+  initial begin
+    if ($value$plusargs("dump_file=%s", dump_file)) begin
+      $dumpfile(dump_file);
+      $dumpvars(0, tb_multi);
+      if ($test$plusargs("dump_window")) begin
+        $dumpoff;
+        forever begin
+          @(posedge dump_window) $dumpon;
+          @(negedge dump_window) $dumpoff;
+          $dumpflush;
+        end
+      end
+    end
+    #1;
+  end
+
+  reg clk;
+
+  // clk comes from cocotb unless +clk_period_ns=<n> is given, as in tb.v
+  integer clk_period_ns;
+  initial begin
+    if ($value$plusargs("clk_period_ns=%d", clk_period_ns)) begin
+      clk = 1'b1;
+      forever #(clk_period_ns / 2.0) clk = ~clk;
+    end
+  end
+
+  genvar i;
+  generate
+    for (i = 0; i < N; i = i + 1) begin : cpu
+      reg rst_n;
+      reg ena;
+      reg [7:0] ui_in;
+      reg [7:0] uio_in;
+      wire [7:0] uo_out;
+      wire [7:0] uio_out;
+      wire [7:0] uio_oe;
+
+      tt_um_6502 user_project (
+          .ui_in  (ui_in),
+          .uo_out (uo_out),
+          .uio_in (uio_in),
+          .uio_out(uio_out),
+          .uio_oe (uio_oe),
+          .ena    (ena),
+          .clk    (clk),
+          .rst_n  (rst_n)
+      );
+    end
+  endgenerate
+
+endmodule
@@ -2,541 +2,539 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import cocotb
-from cocotb.clock import Clock
+import glob
+import os
 import random
 
+import backdoor
+import bustrace
 import helper
+import model
+import randprog
+import vectors
+from memory import Memory
+from opcodes import OP
 
 
 @cocotb.test()
 async def test_ASL_ZPG_Clear(dut):
     dut._log.info("Start")
 
-    # Set the clock period to 10 us (100 KHz)
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    helper.start_clock(dut)
 
     # test instruction on it's own
     for test_num in range(256):
         memory_addr_with_value = random.randint(10, 255)
-        await helper.reset_cpu(dut)
-
-        cval = test_num
-        pc = 1
-
-        for _ in range(8):
-            await helper.test_zpg_instruction(
-                dut,
-                helper.hex_to_num("06"),
-                memory_addr_with_value,
-                pc,
-                cval,
-                (cval * 2) % 256,
-            )
-            cval = (cval * 2) % 256
-            pc += 2
-
-        assert cval == 0
+        if helper.skip_vector(test_num):
+            continue
+        with helper.vector(dut, test_num):
+            await helper.reset_cpu(dut)
+
+            cval = test_num
+            pc = 1
+
+            for _ in range(8):
+                ncval, _ = model.rmw(OP.ASL_ZPG, cval)
+                await helper.test_zpg_instruction(
+                    dut,
+                    OP.ASL_ZPG,
+                    memory_addr_with_value,
+                    pc,
+                    cval,
+                    ncval,
+                )
+                cval = ncval
+                pc += 2
+
+            assert cval == 0
 
 
 @cocotb.test()
 async def test_ASL_ZPG_Base(dut):
     dut._log.info("Start")
 
-    # Set the clock period to 10 us (100 KHz)
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    helper.start_clock(dut)
 
-    # test instruction on it's own
-    for test_num in range(256):
-        memory_addr_with_value = random.randint(10, 255)
-        await helper.reset_cpu(dut)
-        await helper.test_zpg_instruction(
-            dut,
-            helper.hex_to_num("06"),
-            memory_addr_with_value,
-            1,
-            test_num,
-            (test_num * 2) % 256,
-        )
+    await helper.stream_vectors(dut, vectors.rmw_vectors(OP.ASL_ZPG))
 
 
 @cocotb.test()
 async def test_LSR_ZPG_Clear(dut):
     dut._log.info("Start")
 
-    # Set the clock period to 10 us (100 KHz)
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    helper.start_clock(dut)
 
     # test instruction on it's own
     for test_num in range(256):
         memory_addr_with_value = random.randint(10, 255)
-        await helper.reset_cpu(dut)
-
-        cval = test_num
-        pc = 1
-
-        for _ in range(8):
-            await helper.test_zpg_instruction(
-                dut,
-                helper.hex_to_num("46"),
-                memory_addr_with_value,
-                pc,
-                cval,
-                (cval // 2) % 256,
-            )
-            cval = (cval // 2) % 256
-            pc += 2
-
-        assert cval == 0
+        if helper.skip_vector(test_num):
+            continue
+        with helper.vector(dut, test_num):
+            await helper.reset_cpu(dut)
+
+            cval = test_num
+            pc = 1
+
+            for _ in range(8):
+                ncval, _ = model.rmw(OP.LSR_ZPG, cval)
+                await helper.test_zpg_instruction(
+                    dut,
+                    OP.LSR_ZPG,
+                    memory_addr_with_value,
+                    pc,
+                    cval,
+                    ncval,
+                )
+                cval = ncval
+                pc += 2
+
+            assert cval == 0
 
 
 @cocotb.test()
 async def test_LSR_ZPG_Base(dut):
     dut._log.info("Start")
 
-    # Set the clock period to 10 us (100 KHz)
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    helper.start_clock(dut)
 
-    for test_num in range(256):
-        memory_addr_with_value = random.randint(10, 255)
-        await helper.reset_cpu(dut)
-        await helper.test_zpg_instruction(
-            dut,
-            helper.hex_to_num("46"),
-            memory_addr_with_value,
-            1,
-            test_num,
-            (test_num // 2),
-        )
+    await helper.stream_vectors(dut, vectors.rmw_vectors(OP.LSR_ZPG))
 
 
 @cocotb.test()
 async def test_ROL_ZPG_Loop(dut):
     dut._log.info("Start")
 
-    # Set the clock period to 10 us (100 KHz)
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    helper.start_clock(dut)
 
     # test instruction on it's own
     for test_num in range(256):
         memory_addr_with_value = random.randint(10, 255)
-        await helper.reset_cpu(dut)
-
-        cval = test_num
-        carry = 0
-        pc = 1
-
-        for _ in range(8):
-            carry = cval // 128
-            ncval = ((cval * 2) % 256) + carry
-            await helper.test_zpg_instruction(
-                dut,
-                helper.hex_to_num("26"),
-                memory_addr_with_value,
-                pc,
-                cval,
-                ncval,
-            )
-            cval = ncval
-            pc += 2
-
-        assert cval == test_num
+        if helper.skip_vector(test_num):
+            continue
+        with helper.vector(dut, test_num):
+            await helper.reset_cpu(dut)
+
+            cval = test_num
+            pc = 1
+
+            for _ in range(8):
+                ncval, _ = model.rmw(OP.ROL_ZPG, cval)
+                await helper.test_zpg_instruction(
+                    dut,
+                    OP.ROL_ZPG,
+                    memory_addr_with_value,
+                    pc,
+                    cval,
+                    ncval,
+                )
+                cval = ncval
+                pc += 2
+
+            assert cval == test_num
 
 
 @cocotb.test()
 async def test_ROL_ZPG_Base(dut):
     dut._log.info("Start")
 
-    # Set the clock period to 10 us (100 KHz)
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    helper.start_clock(dut)
 
-    for test_num in range(256):
-        memory_addr_with_value = random.randint(10, 255)
-        await helper.reset_cpu(dut)
-        await helper.test_zpg_instruction(
-            dut,
-            helper.hex_to_num("26"),
-            memory_addr_with_value,
-            1,
-            test_num,
-            (test_num * 2) % 256 + test_num // 128,
-        )
+    await helper.stream_vectors(dut, vectors.rmw_vectors(OP.ROL_ZPG))
 
 
 @cocotb.test()
 async def test_ROR_ZPG_Loop(dut):
     dut._log.info("Start")
 
-    # Set the clock period to 10 us (100 KHz)
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    helper.start_clock(dut)
 
     # test instruction on it's own
     for test_num in range(256):
         memory_addr_with_value = random.randint(10, 255)
-        await helper.reset_cpu(dut)
-
-        cval = test_num
-        carry = 0
-        pc = 1
-
-        for _ in range(8):
-            carry = cval % 2
-            ncval = ((cval // 2) % 256) + 128 * carry
-            await helper.test_zpg_instruction(
-                dut,
-                helper.hex_to_num("66"),
-                memory_addr_with_value,
-                pc,
-                cval,
-                ncval,
-            )
-            cval = ncval
-            pc += 2
-
-        assert cval == test_num
+        if helper.skip_vector(test_num):
+            continue
+        with helper.vector(dut, test_num):
+            await helper.reset_cpu(dut)
+
+            cval = test_num
+            pc = 1
+
+            for _ in range(8):
+                ncval, _ = model.rmw(OP.ROR_ZPG, cval)
+                await helper.test_zpg_instruction(
+                    dut,
+                    OP.ROR_ZPG,
+                    memory_addr_with_value,
+                    pc,
+                    cval,
+                    ncval,
+                )
+                cval = ncval
+                pc += 2
+
+            assert cval == test_num
 
 
 @cocotb.test()
 async def test_ROR_ZPG_Base(dut):
     dut._log.info("Start")
 
-    # Set the clock period to 10 us (100 KHz)
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    helper.start_clock(dut)
 
-    for test_num in range(256):
-        memory_addr_with_value = random.randint(10, 255)
-        await helper.reset_cpu(dut)
-        await helper.test_zpg_instruction(
-            dut,
-            helper.hex_to_num("66"),
-            memory_addr_with_value,
-            1,
-            test_num,
-            (test_num // 2) % 256 + 128 * (test_num % 2),
-        )
+    await helper.stream_vectors(dut, vectors.rmw_vectors(OP.ROR_ZPG))
 
 
 @cocotb.test()
 async def test_ASL_ABS_Clear(dut):
     dut._log.info("Start")
 
-    # Set the clock period to 10 us (100 KHz)
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    helper.start_clock(dut)
 
     # test instruction on it's own
     for test_num in range(256):
         memory_addr_with_value_LB = random.randint(10, 255)
         memory_addr_with_value_HB = random.randint(1, 255)
-        await helper.reset_cpu(dut)
-
-        cval = test_num
-        pc = 1
-
-        for _ in range(8):
-            await helper.run_abs_instruction(
-                dut,
-                helper.hex_to_num("0e"),
-                memory_addr_with_value_HB,
-                memory_addr_with_value_LB,
-                pc,
-                cval,
-                (cval * 2) % 256,
-            )
-            cval = (cval * 2) % 256
-            pc += 3
-
-        assert cval == 0
+        if helper.skip_vector(test_num):
+            continue
+        with helper.vector(dut, test_num):
+            await helper.reset_cpu(dut)
+
+            cval = test_num
+            pc = 1
+
+            for _ in range(8):
+                ncval, _ = model.rmw(OP.ASL_ABS, cval)
+                await helper.run_abs_instruction(
+                    dut,
+                    OP.ASL_ABS,
+                    memory_addr_with_value_HB,
+                    memory_addr_with_value_LB,
+                    pc,
+                    cval,
+                    ncval,
+                )
+                cval = ncval
+                pc += 3
+
+            assert cval == 0
 
 
 @cocotb.test()
 async def test_ASL_ABS_Base(dut):
-    # Set the clock period to 10 us (100 KHz)
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    helper.start_clock(dut)
 
-    for test_num in range(256):
-        memory_addr_with_value_LB = random.randint(10, 255)
-        memory_addr_with_value_HB = random.randint(1, 255)
-        await helper.reset_cpu(dut)
-        await helper.run_abs_instruction(
-            dut,
-            helper.hex_to_num("0e"),
-            memory_addr_with_value_HB,
-            memory_addr_with_value_LB,
-            1,
-            test_num,
-            (test_num * 2) % 256,
-        )
+    await helper.stream_vectors(dut, vectors.rmw_vectors(OP.ASL_ABS, absolute=True))
 
 
 @cocotb.test()
 async def test_LSR_ABS_Clear(dut):
     dut._log.info("Start")
 
-    # Set the clock period to 10 us (100 KHz)
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    helper.start_clock(dut)
 
     # test instruction on it's own
     for test_num in range(256):
         memory_addr_with_value_LB = random.randint(10, 255)
         memory_addr_with_value_HB = random.randint(1, 255)
-        await helper.reset_cpu(dut)
-
-        cval = test_num
-        pc = 1
-
-        for _ in range(8):
-            await helper.run_abs_instruction(
-                dut,
-                helper.hex_to_num("4e"),
-                memory_addr_with_value_HB,
-                memory_addr_with_value_LB,
-                pc,
-                cval,
-                (cval // 2) % 256,
-            )
-            cval = (cval // 2) % 256
-            pc += 3
-
-        assert cval == 0
+        if helper.skip_vector(test_num):
+            continue
+        with helper.vector(dut, test_num):
+            await helper.reset_cpu(dut)
+
+            cval = test_num
+            pc = 1
+
+            for _ in range(8):
+                ncval, _ = model.rmw(OP.LSR_ABS, cval)
+                await helper.run_abs_instruction(
+                    dut,
+                    OP.LSR_ABS,
+                    memory_addr_with_value_HB,
+                    memory_addr_with_value_LB,
+                    pc,
+                    cval,
+                    ncval,
+                )
+                cval = ncval
+                pc += 3
+
+            assert cval == 0
 
 
 @cocotb.test()
 async def test_LSR_ABS_Base(dut):
-    # Set the clock period to 10 us (100 KHz)
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    helper.start_clock(dut)
 
-    for test_num in range(256):
-        memory_addr_with_value_LB = random.randint(10, 255)
-        memory_addr_with_value_HB = random.randint(1, 255)
-        await helper.reset_cpu(dut)
-        await helper.run_abs_instruction(
-            dut,
-            helper.hex_to_num("4e"),
-            memory_addr_with_value_HB,
-            memory_addr_with_value_LB,
-            1,
-            test_num,
-            (test_num // 2) % 256,
-        )
+    await helper.stream_vectors(dut, vectors.rmw_vectors(OP.LSR_ABS, absolute=True))
 
 
 @cocotb.test()
 async def test_ROL_ABS_Loop(dut):
     dut._log.info("Start")
 
-    # Set the clock period to 10 us (100 KHz)
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    helper.start_clock(dut)
 
     # test instruction on it's own
     for test_num in range(256):
         memory_addr_with_value_LB = random.randint(10, 255)
         memory_addr_with_value_HB = random.randint(1, 255)
-        await helper.reset_cpu(dut)
-
-        cval = test_num
-        carry = 0
-        pc = 1
-
-        for _ in range(8):
-            carry = cval // 128
-            ncval = ((cval * 2) % 256) + carry
-            await helper.run_abs_instruction(
-                dut,
-                helper.hex_to_num("2e"),
-                memory_addr_with_value_HB,
-                memory_addr_with_value_LB,
-                pc,
-                cval,
-                ncval,
-            )
-            cval = ncval
-            pc += 3
-
-        assert cval == test_num
+        if helper.skip_vector(test_num):
+            continue
+        with helper.vector(dut, test_num):
+            await helper.reset_cpu(dut)
+
+            cval = test_num
+            pc = 1
+
+            for _ in range(8):
+                ncval, _ = model.rmw(OP.ROL_ABS, cval)
+                await helper.run_abs_instruction(
+                    dut,
+                    OP.ROL_ABS,
+                    memory_addr_with_value_HB,
+                    memory_addr_with_value_LB,
+                    pc,
+                    cval,
+                    ncval,
+                )
+                cval = ncval
+                pc += 3
+
+            assert cval == test_num
 
 
 @cocotb.test()
 async def test_ROL_ABS_Base(dut):
-    # Set the clock period to 10 us (100 KHz)
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    helper.start_clock(dut)
 
-    for test_num in range(256):
-        memory_addr_with_value_LB = random.randint(10, 255)
-        memory_addr_with_value_HB = random.randint(1, 255)
-        await helper.reset_cpu(dut)
-        await helper.run_abs_instruction(
-            dut,
-            helper.hex_to_num("2e"),
-            memory_addr_with_value_HB,
-            memory_addr_with_value_LB,
-            1,
-            test_num,
-            (test_num * 2) % 256 + test_num // 128,
-        )
+    await helper.stream_vectors(dut, vectors.rmw_vectors(OP.ROL_ABS, absolute=True))
 
 
 @cocotb.test()
 async def test_ROR_ABS_Loop(dut):
     dut._log.info("Start")
 
-    # Set the clock period to 10 us (100 KHz)
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    helper.start_clock(dut)
 
     # test instruction on it's own
     for test_num in range(256):
         memory_addr_with_value_LB = random.randint(10, 255)
         memory_addr_with_value_HB = random.randint(1, 255)
-        await helper.reset_cpu(dut)
-
-        cval = test_num
-        carry = 0
-        pc = 1
-
-        for _ in range(8):
-            carry = cval % 2
-            ncval = ((cval // 2) % 256) + 128 * carry
-            await helper.run_abs_instruction(
-                dut,
-                helper.hex_to_num("6e"),
-                memory_addr_with_value_HB,
-                memory_addr_with_value_LB,
-                pc,
-                cval,
-                ncval,
-            )
-            cval = ncval
-            pc += 3
-
-        assert cval == test_num
+        if helper.skip_vector(test_num):
+            continue
+        with helper.vector(dut, test_num):
+            await helper.reset_cpu(dut)
+
+            cval = test_num
+            pc = 1
+
+            for _ in range(8):
+                ncval, _ = model.rmw(OP.ROR_ABS, cval)
+                await helper.run_abs_instruction(
+                    dut,
+                    OP.ROR_ABS,
+                    memory_addr_with_value_HB,
+                    memory_addr_with_value_LB,
+                    pc,
+                    cval,
+                    ncval,
+                )
+                cval = ncval
+                pc += 3
+
+            assert cval == test_num
 
 
 @cocotb.test()
 async def test_ROR_ABS_Base(dut):
-    # Set the clock period to 10 us (100 KHz)
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    helper.start_clock(dut)
 
-    for test_num in range(256):
-        memory_addr_with_value_LB = random.randint(10, 255)
-        memory_addr_with_value_HB = random.randint(1, 255)
-        await helper.reset_cpu(dut)
-        await helper.run_abs_instruction(
-            dut,
-            helper.hex_to_num("6e"),
-            memory_addr_with_value_HB,
-            memory_addr_with_value_LB,
-            1,
-            test_num,
-            (test_num // 2) % 256 + 128 * (test_num % 2),
-        )
+    await helper.stream_vectors(dut, vectors.rmw_vectors(OP.ROR_ABS, absolute=True))
 
 
 @cocotb.test()
 async def test_LDX_ZPG_Base(dut):
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    helper.start_clock(dut)
 
-    for test_num in range(1, 256):
-        memory_addr_with_value = random.randint(10, 255)
-        await helper.reset_cpu(dut)
-        await helper.run_input_zpg_instruction(
-            dut, helper.hex_to_num("a6"), memory_addr_with_value, 1, test_num
-        )
-        await helper.test_zpg_instruction(
-            dut, helper.hex_to_num("86"), memory_addr_with_value, 3, 0, test_num
-        )
+    await helper.stream_vectors(dut, vectors.load_vectors(OP.LD_X_ZPG, "x"))
 
 
 @cocotb.test()
 async def test_LDA_ZPG_Base(dut):
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    helper.start_clock(dut)
 
-    for test_num in range(1, 256):
-        memory_addr_with_value = random.randint(10, 255)
-        await helper.reset_cpu(dut)
-        await helper.run_input_zpg_instruction(
-            dut, helper.hex_to_num("a5"), memory_addr_with_value, 1, test_num
-        )
-        await helper.test_zpg_instruction(
-            dut, helper.hex_to_num("85"), memory_addr_with_value, 3, 0, test_num
-        )
+    await helper.stream_vectors(dut, vectors.load_vectors(OP.LD_A_ZPG, "a"))
 
 
 @cocotb.test()
 async def test_LDY_ZPG_Base(dut):
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    helper.start_clock(dut)
 
-    for test_num in range(1, 256):
-        memory_addr_with_value = random.randint(10, 255)
-        await helper.reset_cpu(dut)
-        await helper.run_input_zpg_instruction(
-            dut, helper.hex_to_num("a3"), memory_addr_with_value, 1, test_num
-        )
-        await helper.test_zpg_instruction(
-            dut, helper.hex_to_num("83"), memory_addr_with_value, 3, 0, test_num
-        )
+    await helper.stream_vectors(dut, vectors.load_vectors(OP.LD_Y_ZPG, "y"))
 
 
 @cocotb.test()
 async def test_AND_ZPG_Base(dut):
     dut._log.info("Start")
 
-    # Set the clock period to 10 us (100 KHz)
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    helper.start_clock(dut)
 
-    for test_num in range(256):
-        memory_addr_with_value = random.randint(10, 255)
-        acc_value = random.randint(0, 255)
-        await helper.reset_cpu(dut)
-        await helper.run_input_zpg_instruction(
-            dut, helper.hex_to_num("a5"), memory_addr_with_value, 1, acc_value
-        )  # LDA
-        await helper.run_input_zpg_instruction(
-            dut, helper.hex_to_num("25"), memory_addr_with_value, 3, test_num
-        )  # AND
-        await helper.test_zpg_instruction(
-            dut,
-            helper.hex_to_num("85"),
-            memory_addr_with_value,
-            5,
-            0,
-            test_num & acc_value,
-        )  # STA
+    await helper.stream_vectors(dut, vectors.and_vectors())
 
 
 @cocotb.test()
 async def test_INC_ZPG_Base(dut):
     dut._log.info("Start")
 
-    # Set the clock period to 10 us (100 KHz)
-    clock = Clock(dut.clk, 1, units="us")
-    cocotb.start_soon(clock.start())
+    helper.start_clock(dut)
+
+    await helper.stream_vectors(dut, vectors.rmw_vectors(OP.INC_ZPG))
+
+
+# a wrong expected value on purpose. not when only some vectors run, as it
+# has to run them all
+@cocotb.test(skip=helper.REPLAY_VECTOR is not None or "VECTOR_LIST" in os.environ)
+async def test_Stream_Mismatch(dut):
+    # a vector that fails is reported on its own: stream_vectors resets the
+    # cpu and the vectors after it pass. the failure isn't added to FAILURES
+    helper.start_clock(dut)
+
+    opcode = OP.ASL_ZPG
+    wrong = 3
+    streamed = []
+    for test_num in range(8):
+        expected = model.rmw(opcode, test_num)[0]
+        if test_num == wrong:
+            expected ^= 0xFF
+        streamed.append((opcode, (random.randint(10, 255),), test_num, expected))
+
+    failures = helper.FAILURES
+    helper.FAILURES = os.devnull
+    try:
+        await helper.stream_vectors(dut, streamed)
+    except AssertionError as e:
+        # just the first line, the assertion is rewritten with its expression
+        assert str(e).splitlines()[0] == f"1 vectors failed: [{wrong}]", e
+    else:
+        assert False, f"vector {wrong} passed"
+    finally:
+        helper.FAILURES = failures
 
-    for test_num in range(256):
-        memory_addr_with_value = random.randint(10, 255)
-        await helper.reset_cpu(dut)
-        await helper.test_zpg_instruction(
-            dut,
-            helper.hex_to_num("e6"),
-            memory_addr_with_value,
-            1,
-            test_num,
-            (test_num + 1) % 256,
-        )  # INC
+
+@cocotb.test()
+async def test_Program_Memory(dut):
+    dut._log.info("Start")
+
+    helper.start_clock(dut)
+
+    for index, (data, program, expected) in enumerate(vectors.memory_programs()):
+        if helper.skip_vector(index):
+            continue
+
+        mem = Memory(dut)
+        mem.load(data)
+        with helper.vector(dut, index):
+            await helper.run_program(dut, mem, program)
+            mem.stop()
+
+            assert mem.data == expected
+            assert len(mem.writes) == 7
+
+
+# the lockstep checker follows the decoder state, which the netlist hasn't got
+@cocotb.test(skip=helper.GATES)
+async def test_Random_Lockstep(dut):
+    dut._log.info("Start")
+
+    helper.start_clock(dut)
+
+    for index in range(16):
+        mem = Memory(dut, trace=True)
+        mem.load(random.randbytes(0xFF00), 0x100)
+
+        # $00-$3f is the zero page data, the cpu runs over it first so it
+        # starts out as one byte no-ops
+        mem.load([random.choice(model.NOPS) for _ in range(0x40)])
+        program = []
+        instructions = 0x40
+        while True:
+            opcode = random.choice(model.IMPLEMENTED)
+            length = model.OPS[opcode][1]
+            if 0x40 + len(program) + length > 0x100:
+                break
+            program.append(opcode)
+            if length == 2:
+                program.append(random.randint(0, 0x3F))
+            elif length == 3:
+                program += [random.randint(0, 255), random.randint(2, 255)]
+            instructions += 1
+        mem.load(program, 0x40)
+        if helper.skip_vector(index):
+            continue
+
+        with helper.vector(dut, index):
+            lockstep, checker = model.start_lockstep(dut, mem, instructions + 1)
+            mem.start()
+            await helper.hold_reset(dut)
+            await checker
+            mem.stop()
+
+
+@cocotb.test()
+async def test_Random_Long_Program(dut):
+    # thousands of random instructions in one go, streamed into memory as the
+    # cpu gets to them and checked against the final state of the model (just
+    # its memory at gate level).
+    # PROGRAM_SEED reruns the program of an earlier run
+    dut._log.info("Start")
+
+    helper.start_clock(dut)
+
+    seed = os.environ.get("PROGRAM_SEED")
+    program = randprog.RandomProgram(seed=None if seed is None else int(seed, 0))
+    dut._log.info(f"program seed {program.seed}")
+    golden = program.expected()
+
+    mem = Memory(dut)
+    mem.load(program.memory())
+    feeder = cocotb.start_soon(randprog.stream(mem, program))
+    mem.start()
+    await helper.hold_reset(dut)
+    await mem.wait_for_read(randprog.pin_address(golden.pc + 1))
+    mem.stop()
+    feeder.kill()
+
+    assert mem.data == golden.mem, f"seed {program.seed}: memory differs from model"
+    if helper.GATES:
+        return  # the registers are only there to read in the rtl
+
+    rtl = backdoor.read_state(dut, ("a", "x", "y", "p"))
+    model_state = golden.state()
+    del model_state["pc"]
+    assert rtl == model_state, f"seed {program.seed}: rtl {rtl} != model {model_state}"
+
+
+@cocotb.test(skip="TRACE_REPLAY" not in os.environ)
+async def test_Replay_Traces(dut):
+    # drive the design (normally the gate level netlist) from the pin traces
+    # of an earlier TRACE_RECORD run and compare its outputs cycle by cycle
+    dut._log.info("Start")
+    if "TRACE_REPLAY" not in os.environ:
+        # a test named in TESTCASE runs even when skipped, and run_shards.py
+        # and sim_speed.py --tests all name every test
+        dut._log.info("no TRACE_REPLAY, nothing to replay")
+        return
+
+    helper.start_clock(dut)
+
+    paths = sorted(glob.glob(os.path.join(os.environ["TRACE_REPLAY"], "*.trace")))
+    assert paths, f"no traces in {os.environ['TRACE_REPLAY']}"
+    failed = []
+    for path in paths:
+        name = os.path.basename(path)
+        errors = await bustrace.replay(dut, bustrace.load(path), name)
+        dut._log.info(f"{name}: {errors} mismatching cycles")
+        if errors:
+            failed.append(name)
+
+    assert not failed, f"outputs differ from the recording in {failed}"
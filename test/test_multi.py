@@ -0,0 +1,170 @@
+# SPDX-FileCopyrightText: © 2024 Tiny Tapeout
+# SPDX-License-Identifier: Apache-2.0
+
+# The independent vectors of test.py, run MULTI wide on the cpus of
+# tb_multi.v: every cpu gets every MULTI-th vector, its own Driver or Memory,
+# and its own reset, and the results are logged cpu by cpu. The tests have
+# the names of the ones in test.py they run the vectors of, and random is
+# seeded per test from RANDOM_SEED and that name (helper.start_clock), so
+# with the same seed the vectors come out the same and numbered the same as
+# in test.py. What a cpu runs before a vector does differ, so a failure here
+# is replayed here: helper.vector records MULTI with it for replay.py.
+
+import os
+
+import cocotb
+
+import helper
+import vectors
+from memory import Memory
+from opcodes import OP
+
+MULTI = int(os.environ.get("MULTI", 4))
+
+
+class Lane:
+    # one cpu of tb_multi with the pins tb.v has, so helper, Driver, Memory
+    # and backdoor take it in place of the dut
+    def __init__(self, dut, index):
+        self.index = index
+        self.clk = dut.clk
+        self.dump_window = dut.dump_window
+        self._log = dut._log.getChild(f"cpu{index}")
+        self._scope = dut.cpu[index]
+
+    def __getattr__(self, name):
+        return getattr(self._scope, name)
+
+
+def lanes(dut):
+    # the cpus, with the clock started on the first (which is also the one
+    # TRACE_RECORD, CPI_PROFILE and FUNC_COVERAGE look at)
+    cpus = [Lane(dut, i) for i in range(MULTI)]
+    helper.start_clock(cpus[0])
+    return cpus
+
+
+async def run_lanes(dut, cpus, run):
+    # run(cpu) on every cpu at once and report each one's result. a cpu that
+    # fails doesn't stop the others: the assertion is caught in its own task,
+    # as one that escaped before the task is awaited would end the test
+    async def checked(cpu):
+        try:
+            await run(cpu)
+        except AssertionError as e:
+            cpu._log.error(f"failed: {e}")
+            return False
+        cpu._log.info("passed")
+        return True
+
+    tasks = [cocotb.start_soon(checked(cpu)) for cpu in cpus]
+    failed = [cpu.index for cpu, task in zip(cpus, tasks) if not await task]
+    assert not failed, f"cpus {failed} of {len(cpus)} failed"
+
+
+async def stream_lanes(dut, test_vectors):
+    # hand the vectors out round robin, each cpu runs its share back to back
+    cpus = lanes(dut)
+    numbered = list(enumerate(test_vectors))
+
+    async def run(cpu):
+        share = numbered[cpu.index :: len(cpus)]
+        await helper.stream_vectors(
+            cpu, [v for _, v in share], indices=[i for i, _ in share]
+        )
+
+    await run_lanes(dut, cpus, run)
+
+
+@cocotb.test()
+async def test_ASL_ZPG_Base(dut):
+    await stream_lanes(dut, vectors.rmw_vectors(OP.ASL_ZPG))
+
+
+@cocotb.test()
+async def test_LSR_ZPG_Base(dut):
+    await stream_lanes(dut, vectors.rmw_vectors(OP.LSR_ZPG))
+
+
+@cocotb.test()
+async def test_ROL_ZPG_Base(dut):
+    await stream_lanes(dut, vectors.rmw_vectors(OP.ROL_ZPG))
+
+
+@cocotb.test()
+async def test_ROR_ZPG_Base(dut):
+    await stream_lanes(dut, vectors.rmw_vectors(OP.ROR_ZPG))
+
+
+@cocotb.test()
+async def test_INC_ZPG_Base(dut):
+    await stream_lanes(dut, vectors.rmw_vectors(OP.INC_ZPG))
+
+
+@cocotb.test()
+async def test_ASL_ABS_Base(dut):
+    await stream_lanes(dut, vectors.rmw_vectors(OP.ASL_ABS, absolute=True))
+
+
+@cocotb.test()
+async def test_LSR_ABS_Base(dut):
+    await stream_lanes(dut, vectors.rmw_vectors(OP.LSR_ABS, absolute=True))
+
+
+@cocotb.test()
+async def test_ROL_ABS_Base(dut):
+    await stream_lanes(dut, vectors.rmw_vectors(OP.ROL_ABS, absolute=True))
+
+
+@cocotb.test()
+async def test_ROR_ABS_Base(dut):
+    await stream_lanes(dut, vectors.rmw_vectors(OP.ROR_ABS, absolute=True))
+
+
+@cocotb.test()
+async def test_LDX_ZPG_Base(dut):
+    await stream_lanes(dut, vectors.load_vectors(OP.LD_X_ZPG, "x"))
+
+
+@cocotb.test()
+async def test_LDA_ZPG_Base(dut):
+    await stream_lanes(dut, vectors.load_vectors(OP.LD_A_ZPG, "a"))
+
+
+@cocotb.test()
+async def test_LDY_ZPG_Base(dut):
+    await stream_lanes(dut, vectors.load_vectors(OP.LD_Y_ZPG, "y"))
+
+
+@cocotb.test()
+async def test_AND_ZPG_Base(dut):
+    await stream_lanes(dut, vectors.and_vectors())
+
+
+@cocotb.test()
+async def test_Program_Memory(dut):
+    # the programs of test.py's test_Program_Memory, each cpu running every
+    # MULTI-th one on its own Memory
+    cpus = lanes(dut)
+    programs = list(enumerate(vectors.memory_programs()))
+
+    async def run(cpu):
+        failures = []
+        for index, (data, program, expected) in programs[cpu.index :: len(cpus)]:
+            if helper.skip_vector(index):
+                continue
+            mem = Memory(cpu)
+            mem.load(data)
+            try:
+                with helper.vector(cpu, index):
+                    await helper.run_program(cpu, mem, program)
+                    assert mem.data == expected
+                    assert len(mem.writes) == 7
+            except AssertionError:
+                cpu._log.error(f"program {index} failed")
+                failures.append(index)
+            finally:
+                mem.stop()
+        assert not failures, f"programs {failures} failed"
+
+    await run_lanes(dut, cpus, run)
@@ -0,0 +1,74 @@
+import random
+
+import model
+from opcodes import OP, assemble
+
+# the vectors and programs of the tests in test.py that test_multi.py also
+# runs, MULTI wide. they are drawn from random as they are generated, and
+# helper.start_clock seeds random per test, so with the same RANDOM_SEED a
+# test gets the same ones in both files. see helper.stream_vectors for what
+# a vector is.
+
+
+def rmw_vectors(opcode, absolute=False):
+    # every value through a read-modify-write instruction, at a random zero
+    # page (or absolute) address, checked against the model
+    for test_num in range(256):
+        if absolute:
+            operands = (random.randint(10, 255), random.randint(1, 255))
+        else:
+            operands = (random.randint(10, 255),)
+        yield (opcode, operands, test_num, model.rmw(opcode, test_num)[0])
+
+
+def load_vectors(load_opcode, register):
+    # load a value and check the register and flags it leaves through the
+    # backdoor, rather than storing it back to see it on the bus
+    for test_num in range(1, 256):
+        memory_addr_with_value = random.randint(10, 255)
+        expected = {register: test_num, "p": model.FLG_FLAGS[test_num]}
+        yield (load_opcode, (memory_addr_with_value,), test_num, None, None, expected)
+
+
+def and_vectors():
+    # the accumulator goes in and comes out through the backdoor, rather
+    # than with an LDA before and an STA after
+    for test_num in range(256):
+        memory_addr_with_value = random.randint(10, 255)
+        acc_value = random.randint(0, 255)
+        operand = (memory_addr_with_value,)
+        result = test_num & acc_value
+        expected = {"a": result, "p": model.FLG_FLAGS[result]}
+        yield (OP.AND_ZPG, operand, test_num, None, {"a": acc_value}, expected)
+
+
+def memory_programs(count=32):
+    # (memory, program, memory afterwards) for test_Program_Memory: the same
+    # twelve instructions each time, over random data and a random absolute
+    # address. the program goes in at $0000 and the model runs it for the
+    # memory it should leave, with 7 writes
+    for _ in range(count):
+        abs_addr_HB = random.randint(1, 255)
+        abs_addr_LB = random.randint(10, 255)
+
+        data = bytearray(0x10000)
+        data[0x80:0x87] = bytes(random.randint(0, 255) for _ in range(7))
+        data[(abs_addr_HB << 8) | abs_addr_LB] = random.randint(0, 255)
+        program = assemble(f"""
+            NOP
+            LDA $80
+            AND $81
+            STA $90
+            ASL $82
+            LSR $83
+            ROL ${abs_addr_HB:02x}{abs_addr_LB:02x}
+            INC $85
+            LDX $86
+            STX $91
+            LDY $80
+            STY $92
+            """)
+        golden = model.CPU(data)
+        golden.mem[0 : len(program)] = bytes(program)
+        golden.run(12)
+        yield data, program, golden.mem
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""Pick the few test vectors that cover what the whole RTL suite does, for GL.
+
+    python vectorset.py collect              # RTL run, coverage per vector
+    python vectorset.py select               # gl_vectors.json from that
+    python vectorset.py run                  # just those vectors, GATES=yes
+
+collect runs test.py with VECTOR_COVERAGE set. Every vector a test runs
+through helper.vector then gets its own bins: the funccov.py decoder bins
+(opcode and state, arcs, ALU flags) and a rise and a fall bin for every bit
+of the pins and the cpu registers. select keeps adding the vector that covers
+the most bins not covered yet, until everything the suite covered is
+covered, and writes the vectors it picked with the seed of each test. run
+runs only those, against the netlist, with the same seeds. random is seeded
+per test from RANDOM_SEED and the test's name (helper.start_clock), so the
+random vectors come out as they were even though run leaves out tests that
+ran before them in collect.
+"""
+
+import argparse
+import heapq
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+
+import cocotb
+from cocotb.triggers import FallingEdge
+
+import funccov
+from run_shards import find_tests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+COVERAGE = os.path.join(HERE, "sim_build", "vectors.jsonl")
+SELECTION = os.path.join(HERE, "gl_vectors.json")
+
+# bits toggle coverage is kept for, on the tb and in user_project
+TOGGLE_PINS = ["uo_out", "uio_out", "uio_oe"]
+TOGGLE_REGISTERS = [
+    "accumulator",
+    "index_register_x",
+    "index_register_y",
+    "processor_status_register",
+    "pc",
+]
+
+# a vector's bins are numbered one kind after the other, funccov.BINS first
+_OFFSETS = {}
+_offset = 0
+for _name, _size in funccov.BINS.items():
+    _OFFSETS[_name] = _offset
+    _offset += _size
+TOGGLE_OFFSET = _offset
+
+
+class VectorCoverage:
+    # the coverage of each vector on its own, appended to a file as one json
+    # line per vector once it has run
+    def __init__(self):
+        self.coverage = funccov.Coverage()
+        self.path = None
+        self._nets = []
+        self._rise = []
+        self._fall = []
+        self._vector = None
+        self._task = None
+
+    def start(self, dut, path):
+        self.path = path
+        self.coverage.start(dut)
+        if self._task is None:
+            self._task = cocotb.start_soon(self._run(dut))
+        return self._task
+
+    def stop(self):
+        self.coverage.stop()
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    def begin(self, test, index):
+        for bins in self.coverage.bins.values():
+            bins[:] = bytes(len(bins))
+        self._rise = [0] * len(self._nets)
+        self._fall = [0] * len(self._nets)
+        self._vector = (test, index)
+
+    def end(self):
+        if self._vector is None:
+            return
+        test, index = self._vector
+        self._vector = None
+        hits = []
+        for name, bins in self.coverage.bins.items():
+            offset = _OFFSETS[name]
+            hits += [offset + m.start() for m in re.finditer(b"\x01", bins)]
+        offset = TOGGLE_OFFSET
+        for (_, width), rise, fall in zip(self._nets, self._rise, self._fall):
+            for bit in range(width):
+                if (rise >> bit) & 1:
+                    hits.append(offset + 2 * bit)
+                if (fall >> bit) & 1:
+                    hits.append(offset + 2 * bit + 1)
+            offset += 2 * width
+        with open(self.path, "a") as f:
+            record = {
+                "test": test,
+                "index": index,
+                "seed": cocotb.RANDOM_SEED,
+                "bins": hits,
+            }
+            f.write(json.dumps(record) + "\n")
+
+    async def _run(self, dut):
+        project = dut.user_project
+        handles = [getattr(dut, n) for n in TOGGLE_PINS]
+        handles += [getattr(project, n) for n in TOGGLE_REGISTERS]
+        self._nets = [(h, len(h)) for h in handles]
+        self._rise = [0] * len(handles)
+        self._fall = [0] * len(handles)
+        rst_n = dut.rst_n
+        edge = FallingEdge(dut.clk)
+        last = [None] * len(handles)
+        try:
+            while True:
+                await edge
+                reset = rst_n.value
+                if not (reset.is_resolvable and reset.integer):
+                    last = [None] * len(handles)
+                    continue
+                rise = self._rise
+                fall = self._fall
+                for i, handle in enumerate(handles):
+                    value = handle.value
+                    if not value.is_resolvable:
+                        continue
+                    value = value.integer
+                    before = last[i]
+                    if before is not None and value != before:
+                        rise[i] |= value & ~before
+                        fall[i] |= before & ~value
+                    last[i] = value
+        finally:
+            self._task = None
+
+
+# VECTOR_COVERAGE=<file.jsonl> in the Makefile (see helper.INSTRUMENTS):
+# helper.vector brackets every vector with begin_vector and end_vector, and
+# the coverage of each one that passes is appended to the file
+_coverage = VectorCoverage()
+
+
+def start_instrument(dut, path, test):
+    _coverage.start(dut, path)
+
+
+def begin_vector(test, index):
+    _coverage.begin(test, index)
+
+
+def end_vector():
+    _coverage.end()
+
+
+def load_coverage(paths):
+    vectors = []
+    for path in paths:
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        vectors.append(json.loads(line))
+        except OSError:
+            print(f"skipping {path}, no coverage there")
+    return vectors
+
+
+def select(vectors):
+    # greedy set cover. the gain of a vector only ever goes down, so a
+    # vector's gain from the heap is only recomputed when it comes out on top
+    uncovered = set()
+    for vector in vectors:
+        uncovered.update(vector["bins"])
+    total = len(uncovered)
+    bins = [set(v["bins"]) for v in vectors]
+    heap = [(-len(b), i) for i, b in enumerate(bins)]
+    heapq.heapify(heap)
+    chosen = []
+    while uncovered and heap:
+        _, i = heapq.heappop(heap)
+        gain = len(bins[i] & uncovered)
+        if gain == 0:
+            continue
+        if heap and gain < -heap[0][0]:
+            heapq.heappush(heap, (-gain, i))
+            continue
+        chosen.append(i)
+        uncovered -= bins[i]
+    return [vectors[i] for i in chosen], total
+
+
+def selection(chosen):
+    tests = {}
+    for vector in chosen:
+        test = tests.setdefault(vector["test"], {"seed": vector["seed"], "vectors": []})
+        test["vectors"].append(vector["index"])
+    for test in tests.values():
+        test["vectors"].sort()
+    return tests
+
+
+def collect(seed, make_args):
+    if os.path.exists(COVERAGE):
+        os.remove(COVERAGE)
+    cmd = [
+        "make",
+        f"VECTOR_COVERAGE={COVERAGE}",
+        f"RANDOM_SEED={seed}",
+        *make_args,
+    ]
+    return subprocess.run(cmd, cwd=HERE).returncode
+
+
+def run(tests, make_args):
+    # one make per seed, each only running its tests. that a test's vectors
+    # don't depend on what ran before it is down to the per test seeding
+    by_seed = {}
+    for name, test in tests.items():
+        by_seed.setdefault(test["seed"], []).append(name)
+    failed = 0
+    for seed, names in by_seed.items():
+        cmd = [
+            "make",
+            "GATES=yes",
+            f"TESTCASE={','.join(names)}",
+            f"RANDOM_SEED={seed}",
+            f"VECTOR_LIST={SELECTION}",
+            *make_args,
+        ]
+        failed |= subprocess.run(cmd, cwd=HERE).returncode
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("collect")
+    p.add_argument("--seed", type=int)
+    p.add_argument("make_args", nargs="*", help="e.g. SIM=verilator")
+    p = sub.add_parser("select")
+    p.add_argument("coverage", nargs="*", default=[COVERAGE])
+    p = sub.add_parser("run")
+    p.add_argument("make_args", nargs="*")
+    args = parser.parse_args()
+
+    if args.command == "collect":
+        seed = random.getrandbits(32) if args.seed is None else args.seed
+        print(f"collecting with RANDOM_SEED={seed}")
+        return collect(seed, args.make_args)
+
+    if args.command == "select":
+        vectors = load_coverage(args.coverage)
+        if not vectors:
+            print("no vectors, run collect first")
+            return 1
+        chosen, total = select(vectors)
+        tests = selection(chosen)
+        with open(SELECTION, "w") as f:
+            json.dump({"tests": tests}, f, indent=2, sort_keys=True)
+        print(
+            f"{len(chosen)} of {len(vectors)} vectors cover all {total} bins, "
+            f"from {len(tests)} tests"
+        )
+        for name in find_tests("test"):
+            if name in tests:
+                print(f"  {name:<28} {len(tests[name]['vectors']):>4}")
+        return 0
+
+    try:
+        with open(SELECTION) as f:
+            tests = json.load(f)["tests"]
+    except (OSError, ValueError, KeyError):
+        print(f"no selection in {SELECTION}, run select first")
+        return 1
+    return run(tests, args.make_args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
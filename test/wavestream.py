@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""Read bus transactions and decoder states out of a dump as it streams past.
+
+    python wavestream.py bus tb.vcd                   # every bus cycle
+    python wavestream.py bus tb.vcd --start 5400000 --stop 5500000
+    python wavestream.py states tb.fst                # decoder state changes
+    python wavestream.py diff old.vcd new.vcd         # first differences
+
+The dump is read a line at a time and only the few signals needed are kept,
+so memory use stays the same however big it is. .fst files are read through
+fst2vcd (it comes with gtkwave). Times are in ns, as in the cocotb log;
+--start and --stop still have to read through the dump up to the window, but
+don't decode anything outside it and stop reading at its end.
+
+A bus transaction is one cpu cycle: the address from the uo_out high and
+low phases, rw from uio_out[0] and uio_oe, and the data from uio_out for a
+write or uio_in for a read. diff compares two runs transaction by transaction
+(and state by state with --states), ignoring the times.
+"""
+
+import argparse
+import contextlib
+import subprocess
+import sys
+from collections import namedtuple
+
+from cpi import STATES
+
+# time is the falling edge of clk in the low phase, when the address is
+# complete; rw is 1 for a read; oe is uio_oe
+Transaction = namedtuple("Transaction", "time addr data rw oe")
+# the decoder entering state, with the opcode it is working on
+State = namedtuple("State", "time state opcode")
+
+# signals by the end of their hierarchical name. clk_cpu, STATE and OPCODE
+# are only there in rtl dumps of the whole design (DUMP_SCOPE all or
+# decode); without clk_cpu the phase is worked out from clk, see events
+SIGNALS = [
+    "tb.clk",
+    "tb.rst_n",
+    "tb.uo_out",
+    "tb.uio_out",
+    "tb.uio_in",
+    "tb.uio_oe",
+    "user_project.clk_cpu",
+    "instructionDecode.STATE",
+    "instructionDecode.OPCODE",
+]
+CLK, RST_N, UO_OUT, UIO_OUT, UIO_IN, UIO_OE, CLK_CPU, STATE, OPCODE = range(
+    len(SIGNALS)
+)
+
+# vcd time units in ns
+UNITS = {"s": 1e9, "ms": 1e6, "us": 1e3, "ns": 1, "ps": 1e-3, "fs": 1e-6}
+
+
+@contextlib.contextmanager
+def open_dump(path):
+    # the lines of a vcd, or of an fst turned into one
+    if not path.endswith(".fst"):
+        with open(path) as f:
+            yield f
+        return
+    try:
+        proc = subprocess.Popen(
+            ["fst2vcd", path], stdout=subprocess.PIPE, text=True, bufsize=1 << 16
+        )
+    except FileNotFoundError:
+        raise RuntimeError("reading .fst needs fst2vcd (from gtkwave)") from None
+    try:
+        yield proc.stdout
+    finally:
+        proc.stdout.close()
+        proc.kill()
+        proc.wait()
+
+
+def read_header(lines):
+    # reads up to $enddefinitions. returns the variables as (vcd id, name
+    # with its scopes, width, bit numbers from the lsb up), the length of a
+    # time unit in ns and the $timescale as written. several variables can
+    # share an id. a single bit of a bus (as in a netlist) keeps its [n] in
+    # the name
+    variables = []
+    scope = []
+    unit = 1.0
+    timescale = "1ns"
+    tokens = []
+    for line in lines:
+        tokens += line.split()
+        if "$end" not in tokens:
+            continue
+        kind = tokens[0]
+        if kind == "$scope":
+            scope.append(tokens[2])
+        elif kind == "$upscope":
+            scope.pop()
+        elif kind == "$var":
+            name = ".".join(scope + [tokens[4]])
+            width = int(tokens[2])
+            select = tokens[5] if len(tokens) > 6 else ""
+            bits = list(range(width))
+            if ":" in select:
+                msb, lsb = (int(n) for n in select.strip("[]").split(":"))
+                step = 1 if msb >= lsb else -1
+                bits = list(range(lsb, msb + step, step))
+            elif select:
+                name += select
+            variables.append((tokens[3], name, width, bits))
+        elif kind == "$timescale":
+            timescale = "".join(tokens[1:-1])
+            number = timescale.rstrip("munpfs")
+            unit = int(number) * UNITS[timescale[len(number) :]]
+        elif kind == "$enddefinitions":
+            return variables, unit, timescale
+        tokens = []
+    raise ValueError("no $enddefinitions, not a vcd")
+
+
+def _value(text):
+    try:
+        return int(text, 2)
+    except ValueError:
+        return None  # x or z somewhere
+
+
+def changes(path, signals=SIGNALS, stop=None):
+    # yields (time in ns, {signal index: value}) for every time step that
+    # changes any of the signals, in order. a value is None while it has an
+    # x or z in it. signals not in the dump never change. reading stops at
+    # the first time step at or after stop
+    with open_dump(path) as lines:
+        variables, unit, _ = read_header(lines)
+        ids = {}
+        found = set()
+        for ident, name, *_ in variables:
+            for i, signal in enumerate(signals):
+                if i not in found and (name == signal or name.endswith("." + signal)):
+                    ids.setdefault(ident, []).append(i)
+                    found.add(i)
+        time = 0.0
+        step = {}
+        for line in lines:
+            c = line[0:1]
+            if c == "#":
+                if step:
+                    yield time, step
+                    step = {}
+                time = int(line[1:]) * unit
+                if stop is not None and time >= stop:
+                    return
+                continue
+            if c == "$" or not line.strip():
+                continue
+            tokens = line.split()
+            i = 0
+            while i < len(tokens):
+                token = tokens[i]
+                if token[0] in "bBrR":
+                    value = _value(token[1:]) if token[0] in "bB" else None
+                    ident = tokens[i + 1]
+                    i += 2
+                elif token[0] in "01xXzZ":
+                    value = _value(token[0])
+                    ident = token[1:]
+                    i += 1
+                else:
+                    i += 1  # $dumpvars, $end and the like
+                    continue
+                for index in ids.get(ident, ()):
+                    step[index] = value
+        if step:
+            yield time, step
+
+
+def events(path, start=None, stop=None, bus=True, states=True):
+    # Transaction and State tuples, in time order, from start up to stop.
+    # clk_cpu starts low and toggles on every rising edge of clk, which is
+    # what the phase is taken from when the dump doesn't have clk_cpu, so
+    # that only works for a dump that starts at time 0
+    values = [None] * len(SIGNALS)
+    clk_cpu = 0  # used when the dump has no clk_cpu
+    addr_hi = data_out = None
+    pending = None
+    for time, step in changes(path):
+        if stop is not None and time >= stop:
+            if pending is None:
+                return
+            states = False  # just finishing the last transaction
+        old_clk = values[CLK]
+        old_uio_in = values[UIO_IN]
+        for index, value in step.items():
+            values[index] = value
+        clk = values[CLK]
+        if CLK in step and clk != old_clk:
+            if clk == 1:
+                # clk_cpu follows clk's rising edges, and the cpu takes the
+                # data bus as it was just before one
+                clk_cpu ^= 1
+                if pending is not None:
+                    t, addr, rw, oe = pending
+                    pending = None
+                    data = old_uio_in if rw else data_out
+                    if bus and (start is None or t >= start):
+                        yield Transaction(t, addr, data, rw, oe)
+            elif clk == 0 and values[RST_N] == 1:
+                # the middle of a phase, where memory.Memory looks too
+                high = values[CLK_CPU] if values[CLK_CPU] is not None else clk_cpu
+                if high:
+                    addr_hi = values[UO_OUT]
+                    data_out = values[UIO_OUT]
+                elif addr_hi is not None and values[UO_OUT] is not None:
+                    bus_pins = values[UIO_OUT]
+                    pending = (
+                        time,
+                        (addr_hi << 8) | values[UO_OUT],
+                        None if bus_pins is None else bus_pins & 1,
+                        values[UIO_OE],
+                    )
+        if states and STATE in step and values[STATE] is not None:
+            if values[RST_N] == 1 and (start is None or time >= start):
+                yield State(time, values[STATE], values[OPCODE])
+
+
+def transactions(path, start=None, stop=None):
+    return events(path, start, stop, states=False)
+
+
+def state_changes(path, start=None, stop=None):
+    return events(path, start, stop, bus=False)
+
+
+def _key(event):
+    # what diff compares: everything but the time
+    return (type(event).__name__,) + tuple(event[1:])
+
+
+def diff(a, b, states=False, limit=10, start=None, stop=None):
+    # the first limit (index, event in a, event in b) that differ, with None
+    # for the shorter run's missing events. reading stops there
+    ours = events(a, start, stop, states=states)
+    theirs = events(b, start, stop, states=states)
+    found = []
+    index = 0
+    while len(found) < limit:
+        x = next(ours, None)
+        y = next(theirs, None)
+        if x is None and y is None:
+            break
+        if x is None or y is None or _key(x) != _key(y):
+            found.append((index, x, y))
+        index += 1
+    return found
+
+
+def describe(event):
+    if event is None:
+        return "(nothing)"
+    if isinstance(event, Transaction):
+        addr = "----" if event.addr is None else f"{event.addr:04x}"
+        data = "--" if event.data is None else f"{event.data:02x}"
+        rw = {1: "R", 0: "W"}.get(event.rw, "?")
+        return f"{event.time:>14.0f} ns  {rw} {addr} {data}"
+    opcode = "--" if event.opcode is None else f"{event.opcode:02x}"
+    name = STATES.get(event.state, str(event.state))
+    return f"{event.time:>14.0f} ns  {name:<18} op {opcode}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("bus", "states", "diff"):
+        p = sub.add_parser(name)
+        p.add_argument("dump", nargs=2 if name == "diff" else 1)
+        p.add_argument("--start", type=float, help="ns")
+        p.add_argument("--stop", type=float, help="ns")
+        if name == "diff":
+            p.add_argument("--states", action="store_true")
+            p.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "diff":
+        found = diff(*args.dump, args.states, args.limit, args.start, args.stop)
+        for index, x, y in found:
+            print(f"#{index}")
+            print(f"  < {describe(x)}")
+            print(f"  > {describe(y)}")
+        if not found:
+            print("same")
+        return 1 if found else 0
+
+    kinds = {"bus": transactions, "states": state_changes}
+    for event in kinds[args.command](args.dump[0], args.start, args.stop):
+        print(describe(event))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())